@@ -0,0 +1,95 @@
+"""
+Compares repository.dirsize.DirectorySizer with the former recursive
+get_directory_size on a synthetic tree laid out like a restic repository
+(data/00 ... data/ff).
+
+    $ python benchmarks/directory_size.py [--files 1000000] [--path /tmp/tree] [--keep]
+
+Creating one million files takes a while, use --path and --keep to
+reuse the tree for several runs. Only a tree the script created is
+removed afterwards, an existing --path is left alone.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository.dirsize import DirectorySizer  # noqa: E402
+
+
+def legacy_directory_size(directory):
+    """The former implementation of repository.views.get_directory_size"""
+    total = 0
+    try:
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                total += entry.stat().st_size
+            elif entry.is_dir():
+                total += legacy_directory_size(entry.path)
+    except NotADirectoryError:
+        return os.path.getsize(directory)
+    except (PermissionError, FileNotFoundError):
+        return 0
+    return total
+
+
+def make_tree(root, files):
+    data = os.path.join(root, 'data')
+    for index in range(files):
+        directory = os.path.join(data, '{:02x}'.format(index % 256))
+        if index < 256:
+            os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, '{:064x}'.format(index))
+        with open(path, 'wb') as f:
+            # sparse files, the size counts but no blocks are written
+            f.truncate(4096 + index % 4096)
+
+
+def measure(name, func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - t0
+    print('{:<28} {:>8.3f} s {:>16,d} bytes'.format(name, elapsed, result))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=1000000)
+    parser.add_argument('--path', type=str, help='tree to use, created if it does not exist')
+    parser.add_argument('--keep', action='store_true', help='keep the created tree afterwards')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.path is None:
+        root = created = tempfile.mkdtemp(prefix='dirsize-')
+    else:
+        root = args.path
+        # only a tree created here is removed afterwards, never an existing one
+        created = None if os.path.exists(root) else root
+    try:
+        if not os.path.exists(os.path.join(root, 'data')):
+            created = created or os.path.join(root, 'data')
+            t0 = time.perf_counter()
+            make_tree(root, args.files)
+            print('created {:,d} files in {:.1f} s'.format(args.files, time.perf_counter() - t0))
+
+        legacy = measure('recursive (former)', legacy_directory_size, root)
+        cold = DirectorySizer(args.workers)
+        measure('DirectorySizer (cold)', cold.scan, root)
+        warm = DirectorySizer(args.workers, cold.new_cache)
+        result = measure('DirectorySizer (cached)', warm.scan, root)
+        print('{} of {} directories taken from the cache'.format(warm.hits, len(warm.new_cache)))
+        if result != legacy:
+            print('sizes differ!')
+    finally:
+        if created is not None and not args.keep:
+            shutil.rmtree(created)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the restic executable with synthetic, deterministic output.
+
+Every repository looks the same: FAKE_RESTIC_SNAPSHOTS snapshots (one per
+hour) of the path /data, which holds FAKE_RESTIC_DIRS directories with
+FAKE_RESTIC_FILES files each, so 1000 x 1000 gives a tree with a million
+nodes. Nothing is read from or written to the repository path.
+
+    FAKE_RESTIC_SNAPSHOTS   number of snapshots (100)
+    FAKE_RESTIC_DIRS        directories beneath /data (100)
+    FAKE_RESTIC_FILES       files per directory (100)
+    FAKE_RESTIC_FILE_SIZE   size of every file in bytes (65536)
+    FAKE_RESTIC_LATENCY     seconds to wait before any output, like a remote backend (0)
+
+Supported: snapshots, ls, stats, backup, dump, list, cat lock, diff, restore.
+Install it as `restic` in front of the real one, e.g.
+
+    $ mkdir /tmp/fakebin && ln -s $PWD/benchmarks/fake_restic.py /tmp/fakebin/restic
+    $ PATH=/tmp/fakebin:$PATH python manage.py runserver
+"""
+import hashlib
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = '/data'
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# restic --json prints compact JSON
+dumps = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def setting(name, default):
+    return int(os.environ.get('FAKE_RESTIC_' + name, default))
+
+
+def snapshot_id(index):
+    return hashlib.sha256(b'snapshot %d' % index).hexdigest()
+
+
+def snapshot(index):
+    snapshot_time = EPOCH + timedelta(hours=index)
+    full_id = snapshot_id(index)
+    return {
+        'time': snapshot_time.isoformat().replace('+00:00', '.123456789Z'),
+        'parent': snapshot_id(index - 1) if index else None,
+        'tree': hashlib.sha256(b'tree %d' % index).hexdigest(),
+        'paths': [ROOT],
+        'hostname': 'benchmark',
+        'username': 'restic',
+        'uid': 1000,
+        'gid': 1000,
+        'id': full_id,
+        'short_id': full_id[:8],
+        'struct_type': 'snapshot',
+    }
+
+
+def find_snapshot(wanted):
+    if wanted == 'latest':
+        return snapshot(setting('SNAPSHOTS', 100) - 1)
+    for index in range(setting('SNAPSHOTS', 100)):
+        if snapshot_id(index).startswith(wanted):
+            return snapshot(index)
+    sys.stderr.write('Fatal: no matching ID found for prefix "{}"\n'.format(wanted))
+    sys.exit(1)
+
+
+# node lines are formatted from templates, json.dumps of a million dicts is too slow
+DIR_LINE = (
+    '{"name":"%s","type":"dir","path":"%s","uid":1000,"gid":1000,"mode":2147484141,'
+    '"permissions":"drwxr-xr-x","mtime":"2024-01-01T00:00:00.123456789Z",'
+    '"atime":"2024-01-01T00:00:00.123456789Z","ctime":"2024-01-01T00:00:00.123456789Z",'
+    '"struct_type":"node"}\n'
+)
+FILE_LINE = (
+    '{"name":"%s","type":"file","path":"%s","uid":1000,"gid":1000,"size":%d,"mode":420,'
+    '"permissions":"-rw-r--r--","mtime":"2024-01-01T00:00:00.123456789Z",'
+    '"atime":"2024-01-01T00:00:00.123456789Z","ctime":"2024-01-01T00:00:00.123456789Z",'
+    '"struct_type":"node"}\n'
+)
+
+
+def dir_node(path):
+    return DIR_LINE % (os.path.basename(path), path)
+
+
+def file_node(path):
+    return FILE_LINE % (os.path.basename(path), path, setting('FILE_SIZE', 65536))
+
+
+def directory_path(index):
+    return '{}/dir_{:05d}'.format(ROOT, index)
+
+
+def file_path(directory, index):
+    return '{}/file_{:05d}.txt'.format(directory, index)
+
+
+def walk():
+    """All nodes depth first, like restic ls."""
+    yield dir_node(ROOT)
+    size = setting('FILE_SIZE', 65536)
+    files = range(setting('FILES', 100))
+    for d in range(setting('DIRS', 100)):
+        directory = directory_path(d)
+        yield dir_node(directory)
+        for f in files:
+            name = 'file_{:05d}.txt'.format(f)
+            yield FILE_LINE % (name, directory + '/' + name, size)
+
+
+def children(path):
+    """The node of `path` and the nodes directly beneath it."""
+    path = '/' + path.strip('/')
+    if path == ROOT:
+        yield dir_node(ROOT)
+        for d in range(setting('DIRS', 100)):
+            yield dir_node(directory_path(d))
+        return
+    for d in range(setting('DIRS', 100)):
+        directory = directory_path(d)
+        if path == directory:
+            yield dir_node(directory)
+            for f in range(setting('FILES', 100)):
+                yield file_node(file_path(directory, f))
+            return
+        if path.startswith(directory + '/'):
+            yield file_node(path)
+            return
+
+
+def write_lines(lines):
+    sys.stdout.writelines(lines)
+
+
+def write_items(items):
+    write_lines(dumps(item) + '\n' for item in items)
+
+
+def options(args):
+    """Positional arguments and the flags (with their values) of a command."""
+    positional, flags = [], {}
+    args = iter(args)
+    for arg in args:
+        if arg in ('--archive', '--cache-dir', '--target', '--include', '--mode', '--host', '--tag', '--path'):
+            flags[arg] = next(args, None)
+        elif arg.startswith('-'):
+            flags[arg] = True
+        else:
+            positional.append(arg)
+    return positional, flags
+
+
+def cmd_snapshots(args, flags):
+    if args:
+        snapshots = [find_snapshot(wanted) for wanted in args]
+    else:
+        snapshots = [snapshot(index) for index in range(setting('SNAPSHOTS', 100))]
+    print(dumps(snapshots))
+
+
+def cmd_ls(args, flags):
+    write_items([find_snapshot(args[0])])
+    if len(args) > 1 and '--recursive' not in flags:
+        write_lines(children(args[1]))
+    else:
+        write_lines(walk())
+
+
+def cmd_stats(args, flags):
+    files = setting('DIRS', 100) * setting('FILES', 100)
+    size = files * setting('FILE_SIZE', 65536)
+    if flags.get('--mode') == 'raw-data':
+        print(dumps({'total_size': size // 2, 'total_uncompressed_size': size, 'total_blob_count': files, 'snapshots_count': setting('SNAPSHOTS', 100)}))
+    else:
+        print(dumps({'total_size': size, 'total_file_count': files + setting('DIRS', 100) + 1, 'snapshots_count': len(args) or setting('SNAPSHOTS', 100)}))
+
+
+def cmd_backup(args, flags):
+    total_files = setting('DIRS', 100) * setting('FILES', 100)
+    total_bytes = total_files * setting('FILE_SIZE', 65536)
+    for step in range(1, 11):
+        write_items([{
+            'message_type': 'status', 'seconds_elapsed': step, 'seconds_remaining': 10 - step,
+            'percent_done': step / 10, 'total_files': total_files, 'files_done': total_files * step // 10,
+            'total_bytes': total_bytes, 'bytes_done': total_bytes * step // 10,
+        }])
+    write_items([{
+        'message_type': 'summary', 'files_new': 0, 'files_changed': 0, 'files_unmodified': total_files,
+        'total_files_processed': total_files, 'total_bytes_processed': total_bytes,
+        'total_duration': 10, 'snapshot_id': snapshot_id(setting('SNAPSHOTS', 100)),
+    }])
+
+
+def cmd_dump(args, flags):
+    path = '/' + args[1].strip('/')
+    if path.startswith(ROOT + '/dir_') and path.endswith('.txt'):
+        size = setting('FILE_SIZE', 65536)
+    else:
+        # an archive of a directory, roughly the size of its files
+        size = setting('FILE_SIZE', 65536) * setting('FILES', 100)
+    chunk = bytes(range(256)) * 256
+    out = sys.stdout.buffer
+    while size > 0:
+        out.write(chunk[:size])
+        size -= len(chunk)
+
+
+def cmd_list(args, flags):
+    if args[0] == 'snapshots':
+        print('\n'.join(snapshot_id(index) for index in range(setting('SNAPSHOTS', 100))))
+    # no locks, keys, ...
+
+
+def cmd_cat(args, flags):
+    sys.stderr.write('Fatal: {} {} not found\n'.format(*args[:2]))
+    sys.exit(1)
+
+
+def cmd_diff(args, flags):
+    source, target = find_snapshot(args[0]), find_snapshot(args[1])
+    changed = file_path(directory_path(0), 0)
+    write_items([
+        {'message_type': 'change', 'path': changed, 'modifier': 'M'},
+        {'message_type': 'statistics', 'source_snapshot': source['id'], 'target_snapshot': target['id'],
+         'changed_files': 1, 'added': {'files': 1, 'bytes': setting('FILE_SIZE', 65536)},
+         'removed': {'files': 1, 'bytes': setting('FILE_SIZE', 65536)}},
+    ])
+
+
+def cmd_restore(args, flags):
+    find_snapshot(args[0])
+    write_items([{'message_type': 'summary', 'total_files': 1, 'files_restored': 1}])
+
+
+COMMANDS = {
+    'snapshots': cmd_snapshots,
+    'ls': cmd_ls,
+    'stats': cmd_stats,
+    'backup': cmd_backup,
+    'dump': cmd_dump,
+    'list': cmd_list,
+    'cat': cmd_cat,
+    'diff': cmd_diff,
+    'restore': cmd_restore,
+}
+
+
+def main(argv):
+    args = argv[1:]
+    # global options before the command
+    while args and args[0].startswith('-'):
+        option = args.pop(0)
+        if option in ('-r', '--repo', '--cache-dir', '--password-file') and args:
+            args.pop(0)
+    if not args or args[0] not in COMMANDS:
+        sys.stderr.write('unknown command: {}\n'.format(' '.join(args)))
+        return 1
+    time.sleep(float(os.environ.get('FAKE_RESTIC_LATENCY', 0)))
+    positional, flags = options(args[1:])
+    try:
+        COMMANDS[args[0]](positional, flags)
+    except BrokenPipeError:
+        # the reader stopped early, like restic killed by ResticStream
+        sys.stderr.close()
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,89 @@
+"""
+Compares the record types of repository.parsing with the former
+json.loads(..., object_hook=SimpleNamespace) approach.
+
+    $ python benchmarks/parsing.py [--nodes 100000]
+
+Reports the time and the memory allocated for the parsed nodes
+(tracemalloc) per approach.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from repository import parsing  # noqa: E402
+from repository.parsing import Node  # noqa: E402
+
+
+def make_lines(count):
+    lines = []
+    for i in range(count):
+        lines.append(json.dumps({
+            'name': 'file_{}.txt'.format(i),
+            'type': 'file',
+            'path': '/home/user/dir_{}/file_{}.txt'.format(i // 1000, i),
+            'uid': 1000,
+            'gid': 1000,
+            'size': i * 17,
+            'mode': 420,
+            'permissions': '-rw-r--r--',
+            'mtime': '2024-01-02T03:04:05.123456789+01:00',
+            'atime': '2024-01-02T03:04:05.123456789+01:00',
+            'ctime': '2024-01-02T03:04:05.123456789+01:00',
+            'struct_type': 'node',
+        }).encode())
+    return lines
+
+
+def simple_namespace(lines):
+    return [json.loads(line, object_hook=lambda d: SimpleNamespace(**d)) for line in lines]
+
+
+def records_json(lines):
+    return [Node.from_dict(json.loads(line)) for line in lines]
+
+
+def records_orjson(lines):
+    return [Node.from_dict(parsing.orjson.loads(line)) for line in lines]
+
+
+def measure(name, func, lines):
+    # time and memory are measured in separate runs, tracing slows down allocations
+    t0 = time.perf_counter()
+    result = func(lines)
+    elapsed = time.perf_counter() - t0
+    del result
+    tracemalloc.start()
+    result = func(lines)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    print('{:<20} {:>8.3f} s {:>10.1f} MiB {:>10.1f} MiB'.format(
+        name, elapsed, current / (1 << 20), peak / (1 << 20)
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--nodes', type=int, default=100000)
+    args = parser.parse_args()
+
+    lines = make_lines(args.nodes)
+    print('{} nodes'.format(args.nodes))
+    print('{:<20} {:>10} {:>14} {:>14}'.format('', 'time', 'retained', 'peak'))
+    measure('SimpleNamespace', simple_namespace, lines)
+    measure('Node (json)', records_json, lines)
+    if parsing.orjson is not None:
+        measure('Node (orjson)', records_orjson, lines)
+    else:
+        print('orjson is not installed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Times the hot views against benchmarks/fake_restic.py.
+
+Sets up a throw-away database with --repos repositories and --samples
+size samples per repository, puts the fake restic in front of PATH and
+requests every scenario --runs times (after one warm-up request) with
+the Django test client. Streaming responses are consumed completely.
+
+    $ python benchmarks/views.py [--runs 5] [--dirs 1000 --files 1000] [--only browse ...]
+
+Reports min, median and max time per scenario and the peak memory
+allocated by Python during one further request (tracemalloc). The time
+of restic itself is part of the measurement, the memory of restic is not.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'django_restic_gui.settings')
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.core.exceptions import ImproperlyConfigured  # noqa: E402
+
+
+def configure(tmp):
+    """Points the settings to `tmp`, before Django is set up."""
+    settings.DATABASES['default']['NAME'] = os.path.join(tmp, 'db.sqlite3')
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['testserver']
+    # without a localsettings.py
+    try:
+        settings.SECRET_KEY
+    except ImproperlyConfigured:
+        settings.SECRET_KEY = 'benchmark'
+    if not getattr(settings, 'EJF_ENCRYPTION_KEYS', None):
+        from cryptography.fernet import Fernet
+        settings.EJF_ENCRYPTION_KEYS = Fernet.generate_key().decode()
+    settings.LOCAL_BACKUP_PATH = tmp
+    settings.SNAPSHOT_INDEX_PATH = os.path.join(tmp, 'index')
+    settings.DOWNLOAD_CACHE_PATH = None
+    settings.SEARCH_INDEX_PATH = None
+    settings.RESTIC_LOCK_PATH = os.path.join(tmp, 'locks')
+    settings.REQUEST_TIMING = False
+
+
+def install_fake_restic(tmp):
+    bin_dir = os.path.join(tmp, 'bin')
+    os.makedirs(bin_dir)
+    os.symlink(os.path.join(BASE_DIR, 'benchmarks', 'fake_restic.py'), os.path.join(bin_dir, 'restic'))
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+
+
+def make_data(repos, samples):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from repository.models import Repository, RepoSize
+
+    user = User.objects.create_user('benchmark', password='benchmark', is_staff=True)
+    field = RepoSize._meta.get_field('timestamp')
+    field.auto_now_add = False
+    try:
+        start = timezone.now() - timedelta(hours=samples)
+        for index in range(repos):
+            repo = Repository.objects.create(name='repo {}'.format(index), password='secret', path='bench:{}'.format(index))
+            RepoSize.objects.bulk_create(
+                [
+                    RepoSize(
+                        repo=repo, timestamp=start + timedelta(hours=hour),
+                        size=(1 << 30) + hour * 4096, file_count=10000 + hour, raw_size=(1 << 29) + hour * 2048,
+                    )
+                    for hour in range(samples)
+                ],
+                batch_size=2000,
+            )
+    finally:
+        field.auto_now_add = True
+    return user
+
+
+def scenarios(snapshot_id):
+    from django.test import override_settings
+    from repository.models import Repository
+
+    repo = Repository.objects.order_by('pk').first()
+    browse = '/repository/browse/{}/icon/?id={}&path=/data/dir_00000'.format(repo.pk, snapshot_id)
+    return [
+        ('list', '/repository/list/', None),
+        ('chart', '/repository/get_chart/{}/'.format(repo.pk), None),
+        ('charts', '/repository/get_charts/?' + '&'.join(
+            'repo={}'.format(pk) for pk in Repository.objects.values_list('pk', flat=True)
+        ), None),
+        ('snapshots', '/repository/snapshots/{}/'.format(repo.pk), None),
+        ('browse', browse, override_settings(SNAPSHOT_INDEX_PATH=None)),
+        ('browse (index)', browse, None),
+        ('download directory', '/repository/download/{}/icon/?id={}&path=/data/dir_00000'.format(repo.pk, snapshot_id), None),
+        ('download file', '/repository/download/{}/icon/file/?id={}&path=/data/dir_00000/file_00000.txt'.format(
+            repo.pk, snapshot_id), None),
+    ]
+
+
+def request(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError('{} answered {}'.format(url, response.status_code))
+    if response.streaming:
+        for chunk in response.streaming_content:
+            pass
+        response.close()
+    else:
+        response.content
+    return response
+
+
+def measure(client, name, url, context, runs):
+    if context is not None:
+        context.enable()
+    try:
+        request(client, url)
+        times = []
+        for run in range(runs):
+            t0 = time.perf_counter()
+            request(client, url)
+            times.append(time.perf_counter() - t0)
+        tracemalloc.start()
+        request(client, url)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        if context is not None:
+            context.disable()
+    print('{:<20} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} MiB'.format(
+        name, min(times) * 1000, statistics.median(times) * 1000, max(times) * 1000, peak / (1 << 20)
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--repos', type=int, default=20)
+    parser.add_argument('--samples', type=int, default=5000, help='size samples per repository')
+    parser.add_argument('--snapshots', type=int, default=100)
+    parser.add_argument('--dirs', type=int, default=100)
+    parser.add_argument('--files', type=int, default=100, help='files per directory')
+    parser.add_argument('--latency', type=float, default=0, help='seconds every restic call waits')
+    parser.add_argument('--only', nargs='*', help='scenarios to run')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary directory')
+    args = parser.parse_args()
+
+    os.environ.update({
+        'FAKE_RESTIC_SNAPSHOTS': str(args.snapshots),
+        'FAKE_RESTIC_DIRS': str(args.dirs),
+        'FAKE_RESTIC_FILES': str(args.files),
+        'FAKE_RESTIC_LATENCY': str(args.latency),
+    })
+    tmp = tempfile.mkdtemp(prefix='restic_gui_benchmark_')
+    try:
+        configure(tmp)
+        install_fake_restic(tmp)
+        django.setup()
+        from django.core.management import call_command
+        from django.test import Client
+        call_command('migrate', verbosity=0)
+        user = make_data(args.repos, args.samples)
+
+        sys.path.insert(0, os.path.join(BASE_DIR, 'benchmarks'))
+        import fake_restic
+        snapshot_id = fake_restic.snapshot_id(args.snapshots - 1)
+
+        client = Client()
+        client.force_login(user)
+        print('{} repositories, {} samples each, {} snapshots of {} nodes, {} runs'.format(
+            args.repos, args.samples, args.snapshots, 1 + args.dirs * (args.files + 1), args.runs
+        ))
+        print('{:<20} {:>10} {:>10} {:>10} {:>14}'.format('ms', 'min', 'median', 'max', 'peak'))
+        for name, url, context in scenarios(snapshot_id):
+            if args.only and name not in args.only:
+                continue
+            measure(client, name, url, context, args.runs)
+    finally:
+        if args.keep:
+            print('kept', tmp)
+        else:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
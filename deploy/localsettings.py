@@ -32,9 +32,112 @@ AUTH_PASSWORD_VALIDATORS = [
 
 # backup path, should end with a slash
 LOCAL_BACKUP_PATH = '/path/to/your/backups/'
-# temporary path for downloads
-TEMP_PATH = '/path/to/temp/dir/'
+# archive format for downloads of directories ('zip' or 'tar'),
+# the archive is streamed from "restic dump" without temporary files
+DOWNLOAD_ARCHIVE_FORMAT = 'zip'
+
+# cache of single file downloads, repeated and resumed (Range) downloads
+# are served from here without restic, least recently used files are
+# removed above DOWNLOAD_CACHE_MAX_SIZE bytes
+DOWNLOAD_CACHE_PATH = '/path/to/download/cache/'
+DOWNLOAD_CACHE_MAX_SIZE = 1 << 30
 
 # encryption key for restic repository passwords
 # see https://pypi.org/project/django-encrypted-model-fields/
-FIELD_ENCRYPTION_KEY = 'insecure_encryption_key'
\ No newline at end of file
+FIELD_ENCRYPTION_KEY = 'insecure_encryption_key'
+
+# local index of snapshot trees, so browsing a snapshot
+# doesn't have to call restic for every directory
+SNAPSHOT_INDEX_PATH = '/path/to/snapshot/index/dir/'
+# disk budget for all snapshot indexes in bytes
+SNAPSHOT_INDEX_MAX_SIZE = 1 << 30
+
+# restic caches, one directory per repository, default is the restic
+# cache in the home directory ("python manage.py restic_cache --warm")
+# RESTIC_CACHE_PATH = '/path/to/restic/cache/dir/'
+# repositories handled at the same time by "restic_cache --warm" and
+# seconds after which restic is stopped for a single repository
+# RESTIC_CACHE_JOBS = 4
+# RESTIC_CACHE_TIMEOUT = 600
+
+# full-text index of the paths of all snapshots, one file per repository,
+# updated after every backup ("python manage.py search_index")
+# SEARCH_INDEX_PATH = '/path/to/search/index/dir/'
+
+# snapshot diffs are stored once per snapshot pair, only the first
+# n changed paths of a diff are kept for display
+# DIFF_MAX_CHANGES = 10000
+
+# restic processes per repository and in total, further commands wait
+# for a free slot (lock files in RESTIC_LOCK_PATH, default in /tmp);
+# interactive reads like the snapshots page or browsing never wait
+# RESTIC_LOCK_PATH = '/path/to/lock/dir/'
+# RESTIC_REPO_LIMIT = 2
+# RESTIC_GLOBAL_LIMIT = 4
+# seconds a backup waits for an exclusive restic lock of another host,
+# and how often a command is retried when restic reports a lock
+# RESTIC_LOCK_WAIT = 600
+# RESTIC_LOCK_RETRIES = 3
+
+# /metrics shows the restic invocations of the worker process in the
+# Prometheus text format, to staff users or with this bearer token
+# METRICS_TOKEN = 'secret'
+
+# timing breakdown (restic, database, templates) of every request as
+# Server-Timing header and JSON line of the "repository.timing" logger
+# REQUEST_TIMING = True
+# LOGGING = {
+#     'version': 1,
+#     'handlers': {'console': {'class': 'logging.StreamHandler'}},
+#     'loggers': {'repository.timing': {'handlers': ['console'], 'level': 'INFO'}},
+# }
+# profile a fraction of the requests and keep the n slowest profiles
+# REQUEST_PROFILE_PATH = '/path/to/profiles/'
+# REQUEST_PROFILE_SAMPLE = 0.1
+# REQUEST_PROFILE_TOP = 20
+
+# sample the disk usage of local repositories every n seconds
+# in the web process, leave unset when sampling with a cron job
+# ("python manage.py sample_disk_usage")
+# DISK_USAGE_SAMPLE_INTERVAL = 3600
+# samples are kept for n days
+# DISK_USAGE_DAYS = 30
+# remember the size of unchanged directories between two samples
+DISK_USAGE_CACHE_PATH = '/path/to/disk/usage/cache/dir/'
+# number of threads scanning directories, default depends on the cpu count
+# DISK_USAGE_WORKERS = 8
+
+# number of backup and restore jobs the worker
+# ("python manage.py run_jobs") runs at the same time
+JOB_CONCURRENCY = 1
+# seconds between two progress updates of a running job
+JOB_PROGRESS_INTERVAL = 1.0
+# a running job whose worker has not shown a sign of life for n seconds
+# is marked as failed by the other workers
+# JOB_HEARTBEAT_TIMEOUT = 60
+
+# repositories logged at the same time by "python manage.py log_size";
+# "log_size --raw-size" also logs the deduplicated size, which reads the
+# trees of all snapshots, so run it rarely (e.g. daily)
+LOG_SIZE_JOBS = 4
+# seconds after which restic is stopped for a single repository
+# LOG_SIZE_TIMEOUT = 600
+
+# maximum number of points per chart series, older samples are averaged
+CHART_POINTS = 500
+
+# retention of the repository size samples ("python manage.py compact_repo_size"):
+# raw samples are kept for n days, then averaged per hour; hourly averages
+# are kept for n days, then averaged per day and kept forever
+REPO_SIZE_RAW_DAYS = 30
+REPO_SIZE_HOURLY_DAYS = 365
+
+# file icons are kept in memory per process; edits in the admin reach other
+# worker processes through a shared cache, or after FILE_ICON_MAX_AGE seconds
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#         'LOCATION': '/path/to/cache/dir/',
+#     }
+# }
+FILE_ICON_MAX_AGE = 300
@@ -19,8 +19,11 @@ from django.contrib import admin
 from django.shortcuts import redirect
 from django.urls import path, include
 
+from repository.views import restic_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', restic_metrics, name='metrics'),
     path('accounts/', include('accounts.urls')),
     path('repository/', include('repository.urls')),
 
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from repository.models import Repository, FileType, FileExt, RepoSize
+from repository.models import Repository, FileType, FileExt, RepoSize, RepoSizeHourly, RepoSizeDaily, DiskUsage, Job, SnapshotStats, SnapshotDiff
 
 
 @admin.register(Repository)
@@ -33,6 +33,43 @@ class FileExtAdmin(admin.ModelAdmin):
 @admin.register(RepoSize)
 class RepoSizeAdmin(admin.ModelAdmin):
 
-    list_display = ['timestamp', 'repo', 'size', 'file_count', ]
+    list_display = ['timestamp', 'repo', 'size', 'raw_size', 'file_count', ]
     list_filter = ['repo']
     search_fields = ['repo']
+
+
+@admin.register(RepoSizeHourly, RepoSizeDaily)
+class RepoSizeRollupAdmin(admin.ModelAdmin):
+
+    list_display = ['timestamp', 'repo', 'size', 'raw_size', 'file_count', 'samples', ]
+    list_filter = ['repo']
+
+
+@admin.register(SnapshotStats)
+class SnapshotStatsAdmin(admin.ModelAdmin):
+
+    list_display = ['snapshot_id', 'repo', 'size', 'file_count', 'created', ]
+    list_filter = ['repo']
+    search_fields = ['snapshot_id']
+
+
+@admin.register(SnapshotDiff)
+class SnapshotDiffAdmin(admin.ModelAdmin):
+
+    list_display = ['source', 'target', 'repo', 'change_count', 'created', ]
+    list_filter = ['repo']
+    search_fields = ['source', 'target']
+
+
+@admin.register(DiskUsage)
+class DiskUsageAdmin(admin.ModelAdmin):
+
+    list_display = ['timestamp', 'repo', 'size', ]
+    list_filter = ['repo']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+
+    list_display = ['created', 'repo', 'user', 'action', 'status', 'returncode', 'worker', ]
+    list_filter = ['repo', 'action', 'status']
@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.models.signals import post_save, post_delete
 
 
 class RepositoryConfig(AppConfig):
     name = 'repository'
+
+    def ready(self):
+        from repository.disk_usage import start_runner
+        from repository.file_icons import invalidate
+        from repository.models import FileExt, FileType
+
+        # Start with the first request, so management commands never run the sampler
+        request_started.connect(start_runner, dispatch_uid='repository.disk_usage.start_runner')
+
+        for model in (FileExt, FileType):
+            for signal in (post_save, post_delete):
+                signal.connect(invalidate, sender=model, dispatch_uid='repository.file_icons.invalidate')
@@ -1,8 +1,128 @@
+from datetime import timedelta
+from operator import itemgetter
+
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Trunc
 from django.utils.translation import gettext_lazy as _
-from repository.models import RepoSize
+from repository.models import RepoSize, RepoSizeHourly, RepoSizeDaily
+from repository.retention import merge, samples_of
+
+# chart points of a repository, more samples are aggregated per time bucket
+DEFAULT_POINTS = 500
+
+# raw samples and their rollups, see repository/retention.py
+TIERS = (RepoSize, RepoSizeHourly, RepoSizeDaily)
+
+# Trunc kinds and their approximate length, finest first
+BUCKETS = [
+    ('minute', timedelta(minutes=1)),
+    ('hour', timedelta(hours=1)),
+    ('day', timedelta(days=1)),
+    ('week', timedelta(weeks=1)),
+    ('month', timedelta(days=30)),
+    ('year', timedelta(days=365)),
+]
+
+
+def time_unit_for(span):
+    # https://www.chartjs.org/docs/latest/axes/cartesian/time.html#time-units
+    if span <= timedelta(days=2):
+        return 'hour'
+    if span <= timedelta(days=62):
+        return 'day'
+    if span <= timedelta(days=183):
+        return 'week'
+    if span <= timedelta(days=3 * 365):
+        return 'month'
+    return 'year'
+
+
+def bucket_for(span, points):
+    """The finest Trunc kind which needs at most `points` buckets for `span`."""
+    for kind, length in BUCKETS:
+        if span / length <= points:
+            return kind
+    return BUCKETS[-1][0]
+
+
+def tier_queryset(model, repo_ids, start, end):
+    queryset = model.objects.filter(repo_id__in=repo_ids)
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lte=end)
+    return queryset
+
+
+def size_rows_many(repo_ids, start=None, end=None, points=DEFAULT_POINTS):
+    """
+    Returns {repo id: (rows, span)} with the (timestamp, size, file_count,
+    raw_size) rows of the repositories between `start` and `end` and the
+    time span they cover. The raw samples and their hourly and daily
+    rollups are read together, repositories with more than `points` rows
+    are averaged per time bucket in the database. The number of queries
+    does not depend on the number of repositories.
+    """
+    querysets = [tier_queryset(model, repo_ids, start, end) for model in TIERS]
+    bounds = {}
+    for queryset in querysets:
+        tier_bounds = queryset.order_by().values('repo_id').annotate(
+            count=Count('id'), first=Min('timestamp'), last=Max('timestamp')
+        ).values_list('repo_id', 'count', 'first', 'last')
+        for repo_id, count, first, last in tier_bounds:
+            if repo_id in bounds:
+                old_count, old_first, old_last = bounds[repo_id]
+                count, first, last = count + old_count, min(first, old_first), max(last, old_last)
+            bounds[repo_id] = (count, first, last)
+
+    spans = {}
+    kinds = {}
+    for repo_id, (count, first, last) in bounds.items():
+        spans[repo_id] = (end or last) - (start or first)
+        kinds[repo_id] = None if count <= points else bucket_for(spans[repo_id], points)
+
+    rows = {repo_id: [] for repo_id in bounds}
+    fields = ('repo_id', 'timestamp', 'size', 'file_count', 'raw_size')
+    plain = [repo_id for repo_id, kind in kinds.items() if kind is None]
+    if plain:
+        for queryset in querysets:
+            for row in queryset.filter(repo_id__in=plain).values_list(*fields):
+                rows[row[0]].append(row[1:])
+        for repo_id in plain:
+            rows[repo_id].sort(key=itemgetter(0))
 
+    for kind in set(kinds.values()) - {None}:
+        kind_ids = [repo_id for repo_id, repo_kind in kinds.items() if repo_kind == kind]
+        buckets = {}
+        for model, queryset in zip(TIERS, querysets):
+            tier_rows = queryset.filter(repo_id__in=kind_ids).annotate(
+                bucket=Trunc('timestamp', kind)
+            ).order_by().values('repo_id', 'bucket').annotate(
+                avg_size=Avg('size'), avg_file_count=Avg('file_count'), avg_raw_size=Avg('raw_size'),
+                samples=samples_of(model),
+            ).values_list('repo_id', 'bucket', 'avg_size', 'avg_file_count', 'avg_raw_size', 'samples')
+            for repo_id, bucket, size, file_count, raw_size, samples in tier_rows:
+                key = (repo_id, bucket)
+                if key in buckets:
+                    # a bucket at the border of two tiers
+                    old_size, old_file_count, old_raw_size, old_samples = buckets[key]
+                    size = merge(old_size, old_samples, size, samples)
+                    file_count = merge(old_file_count, old_samples, file_count, samples)
+                    raw_size = merge(old_raw_size, old_samples, raw_size, samples)
+                    samples += old_samples
+                buckets[key] = (size, file_count, raw_size, samples)
+        for repo_id, bucket in sorted(buckets):
+            rows[repo_id].append((bucket,) + buckets[repo_id, bucket][:3])
 
-def repo_datasets(index, repo):
+    return {repo_id: (rows[repo_id], spans[repo_id]) for repo_id in bounds}
+
+
+def size_rows(repo, start=None, end=None, points=DEFAULT_POINTS):
+    """Rows and time span of a single repository, see size_rows_many()."""
+    return size_rows_many([repo.pk], start, end, points).get(repo.pk, ([], timedelta(0)))
+
+
+def datasets_from_rows(index, rows, span):
 
     # def color_code(index, opacity):
     #     h = ((index * 60) % 360) / 360.0
@@ -14,6 +134,7 @@ def repo_datasets(index, repo):
     # bg = color_code(index, 0.1)
     fg = "#007bff"
     bg = "#007bff"
+    raw_fg = "#6c757d"
 
     datasets = [{
         'label': str(_('size [GB]')),
@@ -34,21 +155,41 @@ def repo_datasets(index, repo):
         'pointBackgroundColor': fg,
         'backgroundColor': bg,
         'data': [],
+    }, {
+        'label': str(_('raw size [GB]')),
+        'yAxisID': 'y1',
+        'fill': False,
+        'pointRadius': 2.0,
+        'borderColor': raw_fg,
+        'pointBackgroundColor': raw_fg,
+        'backgroundColor': raw_fg,
+        'data': [],
     }]
 
-    queryset = RepoSize.objects.filter(repo__pk=repo.pk)
-
-    # https://www.chartjs.org/docs/latest/axes/cartesian/time.html#time-units
-    time_unit = 'day'
-
-    for row in queryset:
-        datasets[0]['data'].append({
-            'x': row.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            'y': row.size/float(1 << 30)
-        })
-        datasets[1]['data'].append({
-            'x': row.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            'y': row.file_count / 1000
-        })
+    time_unit = time_unit_for(span)
+    size_data, file_data, raw_data = (dataset['data'] for dataset in datasets)
+    gb = float(1 << 30)
+    for timestamp, size, file_count, raw_size in rows:
+        # ISO 8601 with offset, the browser converts to its local time
+        x = timestamp.isoformat(timespec='seconds')
+        size_data.append({'x': x, 'y': size / gb})
+        file_data.append({'x': x, 'y': file_count / 1000})
+        if raw_size is not None:
+            raw_data.append({'x': x, 'y': raw_size / gb})
 
     return datasets, time_unit
+
+
+def repo_datasets(index, repo, start=None, end=None, points=DEFAULT_POINTS):
+    rows, span = size_rows(repo, start, end, points)
+    return datasets_from_rows(index, rows, span)
+
+
+def repos_datasets(repo_ids, start=None, end=None, points=DEFAULT_POINTS):
+    """Returns {repo id: (datasets, time_unit)} of many repositories at once."""
+    rows = size_rows_many(repo_ids, start, end, points)
+    charts = {}
+    for index, repo_id in enumerate(repo_ids):
+        repo_rows, span = rows.get(repo_id, ([], timedelta(0)))
+        charts[repo_id] = datasets_from_rows(index, repo_rows, span)
+    return charts
@@ -0,0 +1,145 @@
+"""
+Conditional GET for pages that only depend on immutable snapshots or on
+a cheap fingerprint of the repository state.
+
+The ETag functions never start restic, a matching If-None-Match is
+answered with 304 before the view runs. Pages also contain the user
+name, the CSRF token and queued messages, so the user, the language and
+the CSRF cookie are part of every ETag and no ETag is given while
+messages are pending.
+"""
+import datetime
+import hashlib
+import os
+import re
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils.cache import patch_cache_control
+
+from repository import file_icons, restic_cache
+from repository.models import Repository, RepoSize, RepoSizeHourly, RepoSizeDaily
+
+FULL_ID = re.compile(r'^[0-9a-f]{64}$')
+
+# a snapshot addressed by its full id never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def has_pending_messages(request):
+    # len() loads the messages without marking them as used
+    return len(messages.get_messages(request)) > 0
+
+
+def make_etag(request, *parts):
+    """Returns None if the page has to be rendered anyway."""
+    if not request.user.is_authenticated or has_pending_messages(request):
+        return None
+    key = [
+        request.user.pk,
+        getattr(request, 'LANGUAGE_CODE', settings.LANGUAGE_CODE),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+    ] + list(parts)
+    return '"{}"'.format(hashlib.sha256(repr(key).encode()).hexdigest()[:32])
+
+
+def is_full_id(snapshot_id):
+    return bool(snapshot_id) and FULL_ID.match(snapshot_id) is not None
+
+
+def snapshots_mtime(repo_id):
+    """
+    Modification time of the snapshots directory of a local repository,
+    it changes whenever a snapshot is added or forgotten. None for
+    remote repositories.
+    """
+    path = Repository.objects.filter(pk=repo_id).values_list('path', flat=True).first()
+    if path is None:
+        return None
+    try:
+        return os.stat(os.path.join(path, 'snapshots')).st_mtime_ns
+    except OSError:
+        return None
+
+
+def browse_etag(request, pk, view='icon'):
+    snapshot_id = request.GET.get('id')
+    if not snapshot_id:
+        return None
+    # the icons of the files are configured in the admin
+    icons_version = cache.get(file_icons.VERSION_KEY, 0)
+    return make_etag(request, 'browse', pk, view, snapshot_id, request.GET.get('path', ''), icons_version)
+
+
+def snapshots_etag(request, pk):
+    mtime = snapshots_mtime(pk)
+    if mtime is None:
+        return None
+    # the page also shows the sampled size of the restic cache, which
+    # grows without a new snapshot, e.g. while browsing
+    cache_size = restic_cache.size_label(Repository(pk=pk))
+    return make_etag(request, 'snapshots', pk, mtime, cache_size)
+
+
+def snapshots_last_modified(request, pk):
+    mtime = snapshots_mtime(pk)
+    if mtime is None:
+        return None
+    return datetime.datetime.fromtimestamp(mtime / 1e9, tz=datetime.timezone.utc)
+
+
+def chart_state(request, repo_ids):
+    """
+    Number and latest timestamp of the size samples in every tier. Kept
+    on the request, the ETag and the Last-Modified function both need it.
+    """
+    cached = getattr(request, '_chart_state', None)
+    if cached is not None and cached[0] == repo_ids:
+        return cached[1]
+    state = []
+    for model in (RepoSize, RepoSizeHourly, RepoSizeDaily):
+        tier = model.objects.filter(repo_id__in=repo_ids).aggregate(count=Count('id'), last=Max('timestamp'))
+        state.append((tier['count'], tier['last']))
+    request._chart_state = (repo_ids, state)
+    return state
+
+
+def chart_repo_ids(request, repo_id=None):
+    """The repositories of a chart request, None if an id is not a number."""
+    if repo_id is not None:
+        return [repo_id]
+    try:
+        return [int(value) for value in request.GET.getlist('repo')]
+    except ValueError:
+        return None
+
+
+def chart_etag(request, repo_id=None):
+    repo_ids = chart_repo_ids(request, repo_id)
+    if repo_ids is None:
+        # the view answers with 400
+        return None
+    return make_etag(request, 'chart', repo_ids, sorted(request.GET.lists()), chart_state(request, repo_ids))
+
+
+def chart_last_modified(request, repo_id=None):
+    repo_ids = chart_repo_ids(request, repo_id)
+    if repo_ids is None:
+        return None
+    timestamps = [last for count, last in chart_state(request, repo_ids) if last is not None]
+    return max(timestamps) if timestamps else None
+
+
+def patch_browse_cache(response, snapshot_id, cacheable):
+    """
+    Pages of a full snapshot id may be kept by the browser, back and
+    forward navigation then needs no request at all. Everything else is
+    revalidated with the ETag.
+    """
+    if cacheable and is_full_id(snapshot_id):
+        patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,112 @@
+"""
+Parallel, incremental directory sizing.
+
+Directories are scanned iteratively by a pool of threads (the stat calls
+release the GIL), hard linked files are counted once per inode and the
+result of every directory is cached with the mtime of the directory.
+A directory's mtime changes whenever an entry is added, removed or
+renamed, so an unchanged directory is not listed again on the next run.
+Files which are modified in place don't touch the mtime of their
+directory, that's fine for restic repositories whose pack files are
+never changed once written.
+
+Run benchmarks/directory_size.py to compare with the former recursive walk.
+"""
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class DirectorySizer:
+    """
+    Sums up the size of all files beneath a directory.
+
+    `cache` maps directory paths to [mtime_ns, size of the files,
+    names of the subdirectories, [[device, inode, size], ...] of hard
+    linked files]. After scan() `new_cache` only holds the directories
+    that still exist and can be stored for the next run.
+    """
+
+    def __init__(self, workers=None, cache=None):
+        self.workers = workers
+        self.cache = cache or {}
+        self.new_cache = {}
+        self.hits = 0
+
+    def scan_directory(self, path):
+        # stat before listing, a change during the scan invalidates the entry next time
+        mtime_ns = os.stat(path).st_mtime_ns
+        cached = self.cache.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            self.hits += 1
+            return path, cached
+
+        size = 0
+        subdirs = []
+        linked = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        if stat.st_nlink > 1:
+                            linked.append([stat.st_dev, stat.st_ino, stat.st_size])
+                        else:
+                            size += stat.st_size
+                except (PermissionError, FileNotFoundError):
+                    continue
+        return path, [mtime_ns, size, subdirs, linked]
+
+    def scan(self, directory):
+        """Returns the `directory` size in bytes."""
+        try:
+            if not os.path.isdir(directory):
+                return os.path.getsize(directory)
+        except (PermissionError, FileNotFoundError):
+            return 0
+
+        total = 0
+        seen = set()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {pool.submit(self.scan_directory, directory)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        path, entry = future.result()
+                    except (PermissionError, FileNotFoundError, NotADirectoryError):
+                        # if for whatever reason we can't open the folder, skip it
+                        continue
+                    self.new_cache[path] = entry
+                    mtime_ns, size, subdirs, linked = entry
+                    total += size
+                    for device, inode, file_size in linked:
+                        if (device, inode) not in seen:
+                            seen.add((device, inode))
+                            total += file_size
+                    for name in subdirs:
+                        pending.add(pool.submit(self.scan_directory, os.path.join(path, name)))
+        return total
+
+
+def load_cache(cache_file):
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_cache(cache_file, cache):
+    # a temporary file of its own for every writer, threads included
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
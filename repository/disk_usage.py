@@ -0,0 +1,179 @@
+"""
+Samples the on-disk size of local repositories.
+
+Walking a repository can take minutes for large backups, so the size is
+recorded as DiskUsage by the sample_disk_usage management command, by an
+optional periodic runner inside the web process (DISK_USAGE_SAMPLE_INTERVAL
+in seconds) or on demand with refresh_async(). Pages only read the latest
+sample. Of several web processes on a host only the one holding a lock
+file runs the periodic sampler. Samples older than DISK_USAGE_DAYS are
+removed. The size of the restic cache of a repository (RESTIC_CACHE_PATH)
+is sampled alongside and kept in a file next to the cache.
+"""
+import datetime
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from repository import governor
+
+from repository.dirsize import DirectorySizer, load_cache, save_cache
+from repository.models import Repository, DiskUsage
+from repository.restic import cache_dir
+
+logger = logging.getLogger(__name__)
+
+_refresh_lock = threading.Lock()
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_directory_size(directory):
+    """
+    Returns the `directory` size in bytes. With DISK_USAGE_CACHE_PATH set
+    unchanged subdirectories are taken from the result of the last run.
+    """
+    cache_path = getattr(settings, 'DISK_USAGE_CACHE_PATH', None)
+    cache_file = None
+    cache = None
+    if cache_path is not None:
+        os.makedirs(cache_path, exist_ok=True)
+        name = hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()
+        cache_file = os.path.join(cache_path, name + '.json')
+        cache = load_cache(cache_file)
+
+    sizer = DirectorySizer(getattr(settings, 'DISK_USAGE_WORKERS', None), cache)
+    total = sizer.scan(directory)
+    if cache_file is not None:
+        save_cache(cache_file, sizer.new_cache)
+    return total
+
+
+def sample(repo):
+    """
+    Records the current size of `repo`. Remote repositories (connection
+    strings instead of a local path) are skipped and None is returned.
+    """
+    if not os.path.isdir(repo.path):
+        return None
+    return DiskUsage.objects.create(repo=repo, size=get_directory_size(repo.path))
+
+
+def cache_size_file(repo):
+    return cache_dir(repo) + '.size'
+
+
+def sample_cache(repo):
+    """
+    Records the size of the restic cache of `repo` for stored_cache_size(),
+    returns it. None without RESTIC_CACHE_PATH.
+    """
+    directory = cache_dir(repo)
+    if directory is None:
+        return None
+    size = get_directory_size(directory) if os.path.isdir(directory) else 0
+    save_cache(cache_size_file(repo), size)
+    return size
+
+
+def stored_cache_size(repo):
+    """The size of the restic cache of `repo` at its last sample, None if there is none."""
+    if cache_dir(repo) is None:
+        return None
+    try:
+        with open(cache_size_file(repo)) as f:
+            return int(json.load(f))
+    except (FileNotFoundError, ValueError, TypeError):
+        return None
+
+
+def prune():
+    """Removes the samples older than DISK_USAGE_DAYS, returns their number."""
+    cutoff = timezone.now() - datetime.timedelta(days=getattr(settings, 'DISK_USAGE_DAYS', 30))
+    deleted, _rows = DiskUsage.objects.filter(timestamp__lt=cutoff).delete()
+    return deleted
+
+
+def sample_all(repos=None):
+    if repos is None:
+        repos = Repository.objects.all()
+    for repo in repos:
+        sample(repo)
+        sample_cache(repo)
+    prune()
+
+
+def _sample_in_thread(repo_ids):
+    try:
+        repos = Repository.objects.all()
+        if repo_ids is not None:
+            repos = repos.filter(pk__in=repo_ids)
+        sample_all(repos)
+    finally:
+        _refresh_lock.release()
+        # the thread owns its own connection, don't leave it open
+        connection.close()
+
+
+def refresh_async(repo_ids=None):
+    """
+    Samples the repositories in a background thread. Returns False if
+    a refresh is already running.
+    """
+    if not _refresh_lock.acquire(blocking=False):
+        return False
+    thread = threading.Thread(target=_sample_in_thread, args=(repo_ids,), daemon=True)
+    thread.start()
+    return True
+
+
+def lock_runner():
+    """
+    Returns the locked lock file of the periodic sampler or None if the
+    runner of another process holds it. The lock is freed when the
+    process ends, then the runner of another process takes over.
+    """
+    lock_file = governor.open_lock('disk-usage-runner')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _run_periodically(interval):
+    lock_file = None
+    while True:
+        try:
+            if lock_file is None:
+                lock_file = lock_runner()
+            if lock_file is not None and _refresh_lock.acquire(blocking=False):
+                _sample_in_thread(None)
+        except Exception:
+            # a failed sample must not end the sampler for the life of the process
+            logger.exception('Sampling the disk usage failed')
+        time.sleep(interval)
+
+
+def start_runner(**kwargs):
+    """
+    Starts the periodic sampler once per process,
+    if DISK_USAGE_SAMPLE_INTERVAL is set.
+    """
+    global _runner
+    interval = getattr(settings, 'DISK_USAGE_SAMPLE_INTERVAL', None)
+    if not interval:
+        return
+    with _runner_lock:
+        if _runner is None:
+            _runner = threading.Thread(target=_run_periodically, args=(interval,), daemon=True)
+            _runner.start()
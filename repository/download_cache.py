@@ -0,0 +1,176 @@
+"""
+On-disk cache of single files dumped from snapshots.
+
+Snapshots never change, so a file dumped once can be served again, or
+resumed with a Range request, without starting restic. Cached files live
+in ``DOWNLOAD_CACHE_PATH/<repo id>/<sha256 of snapshot id and path>`` and
+are evicted least recently used first, as soon as all of them together
+take more than ``DOWNLOAD_CACHE_MAX_SIZE`` bytes. The key always uses the
+full snapshot id (see resolve()), `latest` would serve outdated files.
+"""
+import glob
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+
+from repository import lru, snapshot_index
+from repository.restic import list_directory
+
+TEMP_SUFFIX = '.tmp'
+
+
+def cache_root():
+    return getattr(settings, 'DOWNLOAD_CACHE_PATH', None)
+
+
+def max_size():
+    return getattr(settings, 'DOWNLOAD_CACHE_MAX_SIZE', 1 << 30)
+
+
+def cache_path(repo, snapshot_id, path):
+    key = hashlib.sha256('{}\0{}'.format(snapshot_id, path).encode()).hexdigest()
+    return os.path.join(cache_root(), str(repo.pk), key)
+
+
+def cached_files():
+    if cache_root() is None:
+        return []
+    return [
+        path for path in glob.glob(os.path.join(cache_root(), '*', '*'))
+        if not path.endswith(TEMP_SUFFIX)
+    ]
+
+
+def lookup(repo, snapshot_id, path):
+    """Returns the cached file of `path` or None."""
+    if cache_root() is None or not snapshot_id:
+        return None
+    cached = cache_path(repo, snapshot_id, path)
+    if not os.path.isfile(cached):
+        return None
+    lru.touch(cached)
+    return cached
+
+
+def resolve(repo, snapshot_id, path):
+    """
+    Returns the full id of `snapshot_id` (which may be short or `latest`)
+    and the node of `path` in it, from the snapshot index or a single
+    `restic ls`. (None, None) if either does not exist.
+    """
+    index_path = snapshot_index.find(repo, snapshot_id)
+    if index_path is not None:
+        snapshot, current, children = snapshot_index.browse(index_path, path)
+    else:
+        snapshot, current, children = list_directory(repo, snapshot_id, path)
+    if snapshot is None or current is None:
+        return None, None
+    return snapshot.id, current
+
+
+class CacheWriter:
+    """
+    Collects a dumped file next to its final place in the cache. Only a
+    complete file is moved into the cache by commit(), so readers never
+    see partial files. A file growing beyond DOWNLOAD_CACHE_MAX_SIZE is
+    dropped right away, the remaining chunks are ignored.
+    """
+
+    def __init__(self, repo, snapshot_id, path):
+        self.target = cache_path(repo, snapshot_id, path)
+        os.makedirs(os.path.dirname(self.target), exist_ok=True)
+        fd, self.temp_path = tempfile.mkstemp(dir=os.path.dirname(self.target), suffix=TEMP_SUFFIX)
+        self.file = os.fdopen(fd, 'wb')
+        self.size = 0
+        self.dropped = False
+
+    def write(self, chunk):
+        if self.dropped:
+            return
+        self.size += len(chunk)
+        if self.size > max_size():
+            self.discard()
+            return
+        self.file.write(chunk)
+
+    def commit(self):
+        """Returns the cached file, or None if it was too large for the cache."""
+        if self.dropped:
+            return None
+        self.file.close()
+        os.replace(self.temp_path, self.target)
+        lru.evict(cached_files(), max_size(), keep=self.target)
+        return self.target
+
+    def discard(self):
+        self.dropped = True
+        self.file.close()
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+def dump_command(repo, snapshot_id, path):
+    return ['restic', '-r', repo.path, 'dump', snapshot_id, path]
+
+
+def parse_range(header, size):
+    """
+    Returns the first and last byte position of a single `Range: bytes=`
+    header or None if the whole file has to be sent (no, malformed or
+    multiple ranges). Raises ValueError if the range is not satisfiable.
+    """
+    if not header:
+        return None
+    unit, _sep, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        first = int(first) if first else None
+        last = int(last) if last else None
+    except ValueError:
+        return None
+
+    if first is None:
+        # suffix range, the last `last` bytes
+        if not last:
+            raise ValueError('Empty suffix range')
+        first, last = max(size - last, 0), size - 1
+    elif last is None or last >= size:
+        last = size - 1
+    if first >= size or first > last:
+        raise ValueError('Range not satisfiable')
+    return first, last
+
+
+class RangeFile:
+    """
+    Reads at most `length` bytes of `file` from its current position.
+    Keeps fileno() and tell(), so servers can still use sendfile.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,65 @@
+"""
+Process wide map of file extensions to the SVG path of their file type.
+
+Directory listings render an icon per file, the map turns that into a
+dictionary lookup. Saving or deleting a FileExt or FileType bumps a
+version in the Django cache; every process compares its version at most
+once per second and reloads the map when it changed. With more than one
+worker process the version needs a shared cache backend (see CACHES in
+localsettings.py), FILE_ICON_MAX_AGE bounds how long a process keeps its
+map without one.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from repository.models import FileExt
+
+VERSION_KEY = 'repository:file_icons:version'
+CHECK_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_icons = None
+_version = None
+_loaded = 0
+_checked = 0
+
+
+def max_age():
+    return getattr(settings, 'FILE_ICON_MAX_AGE', 300)
+
+
+def load():
+    return {
+        name.lower(): svg_path
+        for name, svg_path in FileExt.objects.filter(type__isnull=False).values_list('name', 'type__svg_path')
+    }
+
+
+def icon_map():
+    global _icons, _version, _loaded, _checked
+    now = time.monotonic()
+    icons = _icons
+    if icons is not None and now - _checked < CHECK_INTERVAL:
+        return icons
+    with _lock:
+        version = cache.get(VERSION_KEY, 0)
+        if _icons is None or version != _version or now - _loaded > max_age():
+            _icons = load()
+            _version = version
+            _loaded = now
+        _checked = now
+        return _icons
+
+
+def invalidate(**kwargs):
+    """Signal handler, makes every process reload its map."""
+    global _icons
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+    with _lock:
+        _icons = None
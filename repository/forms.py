@@ -1,9 +1,10 @@
 from bootstrap_modal_forms.forms import BSModalForm
 from django import forms
+from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 
-from repository.models import Repository
+from repository.models import ACTION_CHOICES, Repository
 
 
 class RepositoryForm(forms.ModelForm):
@@ -40,4 +41,25 @@ class RestoreForm(BSModalForm):
 
 
 class NewBackupForm(BSModalForm):
-    path = forms.CharField(label=_('Backup directory'))
\ No newline at end of file
+    path = forms.CharField(label=_('Backup directory'))
+
+
+class JournalFilterForm(forms.Form):
+    repo = forms.ModelChoiceField(
+        queryset=Repository.objects.order_by('name'), required=False, label=_('Repository'),
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    action = forms.ChoiceField(
+        choices=(('', '---------'),) + ACTION_CHOICES, required=False, label=_('Action'),
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    user = forms.ModelChoiceField(
+        queryset=User.objects.order_by('username'), required=False, label=_('User'),
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    start = forms.DateField(
+        required=False, label=_('From'), widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    end = forms.DateField(
+        required=False, label=_('Until'), widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
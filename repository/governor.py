@@ -0,0 +1,188 @@
+"""
+Limits the number of restic processes per repository and in total.
+
+Every governed restic command holds a slot while it runs. Slots are
+lock files (flock), so the limits apply to all worker processes and
+management commands of the host, and a slot is freed by the kernel when
+its process dies. A command which finds no free slot waits for one
+instead of failing:
+
+    with governor.slot(repo, command):
+        subprocess.run(command, ...)
+
+RESTIC_REPO_LIMIT commands may run per repository and RESTIC_GLOBAL_LIMIT
+in total. Commands which need an exclusive restic lock (prune, forget,
+...) wait until no other governed command of the repository is running
+and block new ones until they are done.
+
+Before a command which changes the repository starts, `restic list locks`
+is inspected: while a restic outside of the governor (e.g. a cron job
+on another host) holds a conflicting lock, the command waits up to
+RESTIC_LOCK_WAIT seconds.
+
+With a `timeout` (in seconds) slot() gives up waiting and raises
+subprocess.TimeoutExpired, like restic running too long.
+"""
+import contextlib
+import fcntl
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+
+from repository import metrics
+
+POLL_INTERVAL = 0.2
+LOCK_POLL_INTERVAL = 5
+
+# commands which add to or remove from the repository
+MUTATING_COMMANDS = {
+    'backup', 'copy', 'forget', 'init', 'key', 'migrate', 'prune',
+    'rebuild-index', 'recover', 'repair', 'rewrite', 'tag', 'unlock',
+}
+# commands which take an exclusive restic lock
+EXCLUSIVE_COMMANDS = {'forget', 'migrate', 'prune', 'rebuild-index', 'repair', 'unlock'}
+
+# stderr of restic when a lock could not be created
+LOCKED_MESSAGES = (b'repository is already locked', b'unable to create lock')
+
+
+def lock_root():
+    return getattr(settings, 'RESTIC_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'django_restic_gui_locks'))
+
+
+def repo_limit():
+    return getattr(settings, 'RESTIC_REPO_LIMIT', 2)
+
+
+def global_limit():
+    return getattr(settings, 'RESTIC_GLOBAL_LIMIT', 4)
+
+
+def lock_wait():
+    return getattr(settings, 'RESTIC_LOCK_WAIT', 600)
+
+
+def command_name(command):
+    """The restic command of ['restic', '-r', path, <name>, ...]."""
+    args = iter(command[1:])
+    for arg in args:
+        if arg in ('-r', '--repo'):
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def is_mutating(command):
+    return command_name(command) in MUTATING_COMMANDS
+
+
+def is_locked_error(stderr):
+    return any(message in stderr for message in LOCKED_MESSAGES)
+
+
+def open_lock(name):
+    os.makedirs(lock_root(), exist_ok=True)
+    return open(os.path.join(lock_root(), name + '.lock'), 'a')
+
+
+def try_lock(lock_file, operation, deadline):
+    """flock() which gives up at `deadline` (time.monotonic()), returns False then."""
+    if deadline is None:
+        fcntl.flock(lock_file, operation)
+        return True
+    while True:
+        try:
+            fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+
+
+def acquire_slot(prefix, limit, deadline=None):
+    """Waits for one of `limit` lock files and returns it locked, None after `deadline`."""
+    while True:
+        for i in range(max(limit, 1)):
+            lock_file = open_lock('{}-{}'.format(prefix, i))
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except BlockingIOError:
+                lock_file.close()
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        time.sleep(POLL_INTERVAL)
+
+
+@contextlib.contextmanager
+def slot(repo, command, timeout=None):
+    """
+    Holds a slot of `repo` and a global slot while `command` runs. Raises
+    subprocess.TimeoutExpired if no slot is free within `timeout` seconds.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    lock_files = []
+    try:
+        # shared for normal commands, exclusive ones wait for all others
+        gate = open_lock('repo-{}'.format(repo.pk))
+        lock_files.append(gate)
+        exclusive = command_name(command) in EXCLUSIVE_COMMANDS
+        if not try_lock(gate, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, deadline):
+            raise subprocess.TimeoutExpired(command, timeout)
+        for prefix, limit in (('repo-{}-slot'.format(repo.pk), repo_limit()), ('global-slot', global_limit())):
+            lock_file = acquire_slot(prefix, limit, deadline)
+            if lock_file is None:
+                raise subprocess.TimeoutExpired(command, timeout)
+            lock_files.append(lock_file)
+        yield
+    finally:
+        # closing the files releases the locks
+        for lock_file in reversed(lock_files):
+            lock_file.close()
+
+
+def restic_locks(repo, env):
+    """Returns the decoded locks of the repository, [] if restic fails."""
+    command = ['restic', '-r', repo.path, 'list', 'locks', '--no-lock']
+    result = metrics.run(repo, 'list', command, env)
+    if result.returncode != 0:
+        return []
+    locks = []
+    for lock_id in result.stdout.decode().split():
+        command = ['restic', '-r', repo.path, 'cat', 'lock', lock_id, '--no-lock']
+        result = metrics.run(repo, 'cat', command, env)
+        if result.returncode != 0:
+            # removed in the meantime
+            continue
+        try:
+            locks.append(json.loads(result.stdout))
+        except ValueError:
+            continue
+    return locks
+
+
+def wait_for_locks(repo, env, command, timeout=None):
+    """
+    Waits up to RESTIC_LOCK_WAIT (or `timeout`) seconds while restic locks
+    of other processes conflict with `command`: an exclusive lock
+    conflicts with every mutating command, any lock with an exclusive command.
+    """
+    if not is_mutating(command):
+        return
+    exclusive = command_name(command) in EXCLUSIVE_COMMANDS
+    deadline = time.monotonic() + (lock_wait() if timeout is None else min(lock_wait(), timeout))
+    while True:
+        locks = restic_locks(repo, env)
+        if not any(exclusive or lock.get('exclusive') for lock in locks):
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            # let restic report the lock
+            return
+        time.sleep(min(LOCK_POLL_INTERVAL, remaining))
@@ -0,0 +1,255 @@
+"""
+Background jobs for long running restic operations (backup, restore and
+snapshot diffs).
+
+Views only enqueue a Job and return immediately, the run_jobs management
+command claims queued jobs and runs them. The Journal entry is written
+when a job has finished, with its real outcome.
+
+Several workers may share the database. A worker stamps its running jobs
+with its name and a heartbeat; a running job counts as interrupted once
+its heartbeat is older than JOB_HEARTBEAT_TIMEOUT seconds, or at once if
+its worker ran on this host and its process is gone.
+"""
+import datetime
+import logging
+import os
+import socket
+import subprocess
+import time
+
+from django.conf import settings
+from django.db import connection, IntegrityError, transaction
+from django.utils import timezone
+
+from repository import search_index, snapshot_diff
+from repository.models import Job, Journal
+from repository.repo_size import LogRepoSize
+from repository.restic import ResticStream
+
+OUTPUT_LIMIT = 10000
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(user, repo, action, data, **params):
+    return Job.objects.create(user=user, repo=repo, action=action, data=data, params=params)
+
+
+def enqueue_once(key, user, repo, action, data, **params):
+    """
+    Like enqueue(), but returns the queued or running job with the same
+    `key` instead if there is one. A unique constraint on the key of the
+    pending jobs keeps concurrent requests from queueing two.
+    """
+    while True:
+        pending = Job.objects.filter(key=key, status__in=('queued', 'running')).first()
+        if pending is not None:
+            return pending
+        try:
+            with transaction.atomic():
+                return Job.objects.create(user=user, repo=repo, action=action, data=data, params=params, key=key)
+        except IntegrityError:
+            # queued by another request in the meantime
+            continue
+
+
+def worker_name():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def heartbeat_timeout():
+    return getattr(settings, 'JOB_HEARTBEAT_TIMEOUT', 60)
+
+
+def claim(job):
+    """Marks `job` as running. Returns False if another worker was faster."""
+    started = timezone.now()
+    claimed = Job.objects.filter(pk=job.pk, status='queued').update(
+        status='running', started=started, worker=worker_name(), heartbeat=started
+    )
+    job.status, job.started = 'running', started
+    return claimed == 1
+
+
+def claim_next(count):
+    claimed = []
+    for job in Job.objects.filter(status='queued').order_by('created')[:count]:
+        if claim(job):
+            claimed.append(job)
+    return claimed
+
+
+def heartbeat(job_ids):
+    """Shows the other workers that the jobs `job_ids` of this worker are still running."""
+    if job_ids:
+        Job.objects.filter(pk__in=job_ids, status='running').update(heartbeat=timezone.now())
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def is_interrupted(job, own_job_ids=()):
+    if job.pk in own_job_ids:
+        return False
+    stale = timezone.now() - datetime.timedelta(seconds=heartbeat_timeout())
+    if job.heartbeat is None or job.heartbeat < stale:
+        return True
+    host, _sep, pid = job.worker.rpartition(':')
+    if host != socket.gethostname():
+        # alive as long as the heartbeat is
+        return False
+    try:
+        pid = int(pid)
+    except ValueError:
+        return False
+    # the own pid belongs to a former worker, e.g. after a container restart
+    return pid == os.getpid() or not process_exists(pid)
+
+
+def reset_interrupted(own_job_ids=()):
+    """
+    Marks the running jobs whose worker has stopped as failed, except the
+    jobs `own_job_ids` of the calling worker. Returns their number.
+    """
+    running = Job.objects.filter(status='running').only('pk', 'worker', 'heartbeat')
+    interrupted = [job.pk for job in running if is_interrupted(job, own_job_ids)]
+    if not interrupted:
+        return 0
+    return Job.objects.filter(pk__in=interrupted, status='running').update(
+        status='failed', ended=timezone.now(), output='Interrupted'
+    )
+
+
+def fail(job, message):
+    """Marks `job` as failed unless it has already ended, e.g. after an error of its worker."""
+    return Job.objects.filter(pk=job.pk, status='running').update(
+        status='failed', ended=timezone.now(), output=message[-OUTPUT_LIMIT:]
+    )
+
+
+def progress_interval():
+    return getattr(settings, 'JOB_PROGRESS_INTERVAL', 1.0)
+
+
+def parse_progress(item):
+    """Normalizes the status and summary lines of `backup --json` and `restore --json`."""
+    elapsed = item.get('seconds_elapsed') or item.get('total_duration') or 0
+    bytes_done = item.get('bytes_done', item.get('bytes_restored', item.get('total_bytes_processed', 0)))
+    files_done = item.get('files_done', item.get('files_restored', item.get('total_files_processed', 0)))
+    if item.get('message_type') == 'summary':
+        percent_done = 1
+    else:
+        percent_done = item.get('percent_done') or 0
+    return {
+        'percent': round(percent_done * 100, 1),
+        'bytes_done': bytes_done,
+        'total_bytes': item.get('total_bytes', bytes_done),
+        'files_done': files_done,
+        'total_files': item.get('total_files', files_done),
+        'bytes_per_second': int(bytes_done / elapsed) if elapsed else 0,
+        'seconds_elapsed': elapsed,
+        'seconds_remaining': item.get('seconds_remaining'),
+    }
+
+
+def follow(job, command):
+    """
+    Runs `command` (with --json) and stores the progress restic reports,
+    at most once per JOB_PROGRESS_INTERVAL seconds.
+    """
+    last_update = 0
+    with ResticStream(job.repo, command, governed=True) as stream:
+        for item in stream:
+            message_type = item.get('message_type')
+            if message_type == 'status':
+                now = time.monotonic()
+                if now - last_update < progress_interval():
+                    continue
+                last_update = now
+            elif message_type != 'summary':
+                continue
+            job.progress = parse_progress(item)
+            Job.objects.filter(pk=job.pk).update(progress=job.progress)
+    return stream
+
+
+def backup(job):
+    repo = job.repo
+    command = ['restic', '-r', repo.path, 'backup', job.params['path'], '--json']
+    return follow(job, command)
+
+
+def restore(job):
+    repo = job.repo
+    command = [
+        'restic', '-r', repo.path, 'restore', job.params['snapshot_id'],
+        '--include', job.params['path'], '--target', job.params['target'] or '/', '--json'
+    ]
+    return follow(job, command)
+
+
+def diff(job):
+    repo = job.repo
+    snapshot_diff.store(repo, job.params['source'], job.params['target'])
+    # several restic commands, a failing one has raised RuntimeError
+    return subprocess.CompletedProcess(['restic', '-r', repo.path, 'diff'], 0, stderr=b'')
+
+
+RUNNERS = {
+    '1': backup,
+    '3': restore,
+    '6': diff,
+}
+
+
+def run(job):
+    try:
+        result = RUNNERS[job.action](job)
+        job.returncode = result.returncode
+        job.output = result.stderr.decode(errors='replace')[-OUTPUT_LIMIT:]
+        job.status = 'done' if result.returncode == 0 else 'failed'
+    except Exception as e:
+        job.output = str(e)
+        job.status = 'failed'
+    job.ended = timezone.now()
+    job.save(update_fields=['status', 'returncode', 'output', 'ended'])
+
+    Journal.objects.create(
+        user=job.user,
+        repo=job.repo,
+        action=job.action,
+        data=job.data,
+        success=job.status == 'done',
+    )
+    if job.action == '1' and job.status == 'done':
+        try:
+            LogRepoSize(job.repo)
+        except Exception as e:
+            # the backup itself succeeded, only note that its size is missing
+            logger.exception('Logging the size of repository %s failed', job.repo)
+            job.output = '{}\nLogging the repository size failed: {}'.format(job.output, e).strip()[-OUTPUT_LIMIT:]
+            job.save(update_fields=['output'])
+        if search_index.index_root() is not None:
+            # only the new snapshot is indexed, a failure is caught up
+            # by the next update (or the search_index command)
+            try:
+                search_index.update(job.repo)
+            except Exception:
+                logger.exception('Updating the search index of repository %s failed', job.repo)
+    return job
+
+
+def run_in_thread(job):
+    try:
+        return run(job)
+    finally:
+        # every worker thread has its own connection, don't leave it open
+        connection.close()
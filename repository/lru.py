@@ -0,0 +1,44 @@
+"""
+Size-capped least recently used file caches.
+
+The mtime of a cached file is its last use, so the caches need no
+bookkeeping of their own and survive restarts.
+"""
+import os
+
+
+def touch(path):
+    """Marks `path` as recently used."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+
+
+def evict(paths, max_size, keep=None):
+    """
+    Removes the least recently used of `paths` until the remaining files
+    take at most `max_size` bytes. `keep` is never removed.
+    Returns the number of removed files.
+    """
+    files = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for mtime, size, path in files)
+    removed = 0
+    for mtime, size, path in sorted(files):
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+
+from repository import retention
+
+
+class Command(BaseCommand):
+    help = _('Roll up old repository size samples into hourly and daily averages')
+
+    def handle(self, *args, **options):
+        t0 = time.time()
+        raw, hourly = retention.compact()
+        t1 = time.time()
+        self.stdout.write(
+            self.style.SUCCESS(
+                _('%(raw)d samples rolled up hourly, %(hourly)d hourly rollups rolled up daily in %(seconds).2f seconds') % {
+                    'raw': raw, 'hourly': hourly, 'seconds': t1 - t0,
+                }
+            )
+        )
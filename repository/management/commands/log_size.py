@@ -1,9 +1,14 @@
+import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 from django.utils.translation import gettext_lazy as _
 
 from repository.models import Repository
-from repository.views import LogRepoSize
+from repository.repo_size import LogRepoSize
 
 
 class Command(BaseCommand):
@@ -15,38 +20,78 @@ class Command(BaseCommand):
             type=str,
             help=_('Repository, to log the size for, if not provided the size of all repositories is logged.')
         )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=getattr(settings, 'LOG_SIZE_JOBS', 4),
+            help=_('Number of repositories processed at the same time.')
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=getattr(settings, 'LOG_SIZE_TIMEOUT', None),
+            help=_('Seconds after which restic is stopped for a repository.')
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help=_('Log the size even if the snapshots have not changed since the last run.')
+        )
+        parser.add_argument(
+            '--raw-size',
+            action='store_true',
+            help=_('Also log the deduplicated size, restic reads the trees of all snapshots for it.')
+        )
 
     def handle(self, *args, **options):
         if options['repo']:
             try:
-                repo = Repository.objects.get(name=options['repo'])
-                self.log_stats_for_repo(repo)
+                repos = [Repository.objects.get(name=options['repo'])]
             except Repository.DoesNotExist:
                 raise CommandError(_('Repository does not exist: {}'.format(options['repo'])))
         else:
-            repos = Repository.objects.all()
-            for repo in repos:
-                self.log_stats_for_repo(repo)
+            repos = list(Repository.objects.all())
 
-    def log_stats_for_repo(self, repo):
         t0 = time.time()
-        self.stdout.write(
-            self.style.SUCCESS(
-                '%s "%s" ...' % (_('Logging stats for repository'), repo.name)
-            )
-        )
-        try:
-            LogRepoSize(repo)
-            time.sleep(1)
-            t1 = time.time()
-            self.stdout.write(
-                self.style.SUCCESS(
-                    _('done in %.2f seconds') % (t1 - t0)
+        results = []
+        with ThreadPoolExecutor(max_workers=max(1, options['jobs'])) as pool:
+            futures = [
+                pool.submit(
+                    self.log_stats_for_repo, repo, options['timeout'], not options['force'], options['raw_size']
                 )
-            )
+                for repo in repos
+            ]
+            for future in as_completed(futures):
+                results.append(future.result())
+        self.summary(results, time.time() - t0)
+
+    def log_stats_for_repo(self, repo, timeout, skip_unchanged, with_raw_size):
+        t0 = time.time()
+        try:
+            if LogRepoSize(repo, timeout=timeout, skip_unchanged=skip_unchanged, with_raw_size=with_raw_size) is None:
+                status, style = _('unchanged'), self.style.WARNING
+            else:
+                status, style = _('done'), self.style.SUCCESS
+            message = ''
+        except subprocess.TimeoutExpired:
+            status, style, message = _('timeout'), self.style.ERROR, ''
         except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(
-                    str(e)
-                )
-            )
+            status, style, message = _('failed'), self.style.ERROR, str(e)
+        finally:
+            # every worker thread has its own connection, don't leave it open
+            connection.close()
+        duration = time.time() - t0
+        self.stdout.write(style(
+            '%s "%s": %s (%.2f seconds) %s' % (_('Repository'), repo.name, status, duration, message)
+        ))
+        return repo.name, status, duration
+
+    def summary(self, results, elapsed):
+        if not results:
+            return
+        width = max([len(name) for name, status, duration in results] + [len(_('Repository'))])
+        self.stdout.write('')
+        self.stdout.write('%-*s  %-9s  %8s' % (width, _('Repository'), _('Status'), _('Seconds')))
+        for name, status, duration in sorted(results, key=lambda result: -result[2]):
+            self.stdout.write('%-*s  %-9s  %8.2f' % (width, name, status, duration))
+        self.stdout.write('%-*s  %-9s  %8.2f' % (width, _('Total'), len(results), elapsed))
@@ -0,0 +1,92 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import humanize
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.translation import gettext_lazy as _
+
+from repository import restic_cache
+from repository.models import Repository
+
+
+class Command(BaseCommand):
+    help = _('Report, warm up or clean up the restic caches of the repositories')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repo',
+            type=str,
+            help=_('Repository, to handle the cache for, if not provided all repositories are handled.')
+        )
+        parser.add_argument(
+            '--warm',
+            action='store_true',
+            help=_('Load snapshots and index of the repositories into their caches, e.g. after a deploy.')
+        )
+        parser.add_argument(
+            '--cleanup',
+            action='store_true',
+            help=_('Remove unused data and the caches of deleted repositories.')
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            default=getattr(settings, 'RESTIC_CACHE_JOBS', 4),
+            help=_('Number of repositories processed at the same time.')
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=getattr(settings, 'RESTIC_CACHE_TIMEOUT', None),
+            help=_('Seconds after which restic is stopped for a repository.')
+        )
+
+    def handle(self, *args, **options):
+        if restic_cache.cache_root() is None:
+            raise CommandError(_('You need to set RESTIC_CACHE_PATH in localsettings.py to manage the restic caches'))
+
+        if options['repo']:
+            try:
+                repos = [Repository.objects.get(name=options['repo'])]
+            except Repository.DoesNotExist:
+                raise CommandError(_('Repository does not exist: {}'.format(options['repo'])))
+        else:
+            repos = list(Repository.objects.all())
+
+        if options['cleanup']:
+            removed = restic_cache.remove_orphans()
+            self.stdout.write(self.style.SUCCESS(
+                _('Removed the caches of %(count)d deleted repositories') % {'count': removed}
+            ))
+            for repo in repos:
+                self.run_for_repo(_('Cleaning up'), restic_cache.cleanup, repo)
+
+        if options['warm']:
+            with ThreadPoolExecutor(max_workers=max(1, options['jobs'])) as pool:
+                futures = [
+                    pool.submit(self.run_for_repo, _('Warming up'), restic_cache.warm, repo, options['timeout'])
+                    for repo in repos
+                ]
+                for future in as_completed(futures):
+                    future.result()
+
+        for repo in repos:
+            self.stdout.write('%s "%s": %s' % (
+                _('Cache of repository'), repo.name, humanize.naturalsize(restic_cache.size(repo), binary=False)
+            ))
+
+    def run_for_repo(self, action, func, repo, *args):
+        t0 = time.time()
+        try:
+            func(repo, *args)
+            status, style, message = _('done'), self.style.SUCCESS, ''
+        except Exception as e:
+            status, style, message = _('failed'), self.style.ERROR, str(e)
+        finally:
+            # every worker thread has its own connection, don't leave it open
+            connection.close()
+        self.stdout.write(style(
+            '%s "%s": %s (%.2f seconds) %s' % (action, repo.name, status, time.time() - t0, message)
+        ))
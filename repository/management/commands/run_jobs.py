@@ -0,0 +1,78 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext_lazy as _
+
+from repository import jobs
+
+
+class Command(BaseCommand):
+    help = _('Run queued backup and restore jobs')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'JOB_CONCURRENCY', 1),
+            help=_('Number of jobs running at the same time.')
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help=_('Seconds to wait before looking for new jobs.')
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help=_('Exit as soon as no queued jobs are left.')
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+
+        running = {}
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                for future in [future for future in running if future.done()]:
+                    job = running.pop(future)
+                    try:
+                        self.report(future.result())
+                    except Exception as e:
+                        # one broken job must not stop the worker
+                        jobs.fail(job, str(e))
+                        self.stdout.write(self.style.ERROR(
+                            _('Job %s failed: %s') % (job.pk, e)
+                        ))
+
+                own_job_ids = [job.pk for job in running.values()]
+                jobs.heartbeat(own_job_ids)
+                interrupted = jobs.reset_interrupted(own_job_ids)
+                if interrupted:
+                    self.stdout.write(self.style.WARNING(
+                        _('%d interrupted jobs marked as failed') % interrupted
+                    ))
+
+                claimed = jobs.claim_next(concurrency - len(running))
+                for job in claimed:
+                    self.stdout.write(self.style.SUCCESS(
+                        '%s %s "%s" ...' % (_('Starting job'), job.pk, job)
+                    ))
+                    running[pool.submit(jobs.run_in_thread, job)] = job
+
+                if options['once'] and not running and not claimed:
+                    break
+                time.sleep(options['interval'])
+
+    def report(self, job):
+        duration = (job.ended - job.started).total_seconds()
+        if job.status == 'done':
+            self.stdout.write(self.style.SUCCESS(
+                _('Job %s done in %.2f seconds') % (job.pk, duration)
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(
+                _('Job %s failed after %.2f seconds: %s') % (job.pk, duration, job.output)
+            ))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+
+from repository.disk_usage import prune, sample, sample_cache
+from repository.models import Repository
+
+
+class Command(BaseCommand):
+    help = _('Sample the disk usage of local repositories')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repo',
+            type=str,
+            help=_('Repository, to sample the disk usage for, if not provided all repositories are sampled.')
+        )
+
+    def handle(self, *args, **options):
+        if options['repo']:
+            try:
+                repo = Repository.objects.get(name=options['repo'])
+                self.sample_repo(repo)
+            except Repository.DoesNotExist:
+                raise CommandError(_('Repository does not exist: {}'.format(options['repo'])))
+        else:
+            repos = Repository.objects.all()
+            for repo in repos:
+                self.sample_repo(repo)
+        prune()
+
+    def sample_repo(self, repo):
+        # remote repositories have a restic cache as well
+        sample_cache(repo)
+        t0 = time.time()
+        self.stdout.write(
+            self.style.SUCCESS(
+                '%s "%s" ...' % (_('Sampling disk usage of repository'), repo.name)
+            )
+        )
+        if sample(repo) is None:
+            self.stdout.write(self.style.WARNING(_('not a local repository, skipped')))
+        else:
+            t1 = time.time()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    _('done in %.2f seconds') % (t1 - t0)
+                )
+            )
@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+
+from repository import search_index
+from repository.models import Repository
+
+
+class Command(BaseCommand):
+    help = _('Update or drop the path search indexes of the repositories')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repo',
+            type=str,
+            help=_('Repository, to update the index for, if not provided all repositories are indexed.')
+        )
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help=_('Drop the indexes instead of updating them.')
+        )
+
+    def handle(self, *args, **options):
+        if search_index.index_root() is None:
+            raise CommandError(_('You need to set SEARCH_INDEX_PATH in localsettings.py to enable the search'))
+
+        if options['repo']:
+            try:
+                repos = [Repository.objects.get(name=options['repo'])]
+            except Repository.DoesNotExist:
+                raise CommandError(_('Repository does not exist: {}'.format(options['repo'])))
+        else:
+            repos = Repository.objects.all()
+
+        for repo in repos:
+            if options['drop']:
+                search_index.drop(repo)
+                self.stdout.write(
+                    self.style.SUCCESS('%s "%s"' % (_('Dropped search index of repository'), repo.name))
+                )
+            else:
+                self.update_index(repo)
+
+    def update_index(self, repo):
+        t0 = time.time()
+        self.stdout.write(
+            self.style.SUCCESS(
+                '%s "%s" ...' % (_('Updating search index of repository'), repo.name)
+            )
+        )
+        try:
+            added, removed = search_index.update(repo)
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(str(e)))
+            return
+        t1 = time.time()
+        self.stdout.write(
+            self.style.SUCCESS(
+                _('%(added)d snapshots added, %(removed)d removed in %(seconds).2f seconds') % {
+                    'added': added, 'removed': removed, 'seconds': t1 - t0,
+                }
+            )
+        )
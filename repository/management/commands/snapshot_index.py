@@ -0,0 +1,87 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext_lazy as _
+
+from repository import snapshot_index
+from repository.models import Repository
+from repository.parsing import parse_snapshots
+from repository.restic import restic_command
+
+
+class Command(BaseCommand):
+    help = _('Build or drop the local snapshot tree indexes')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repo',
+            type=str,
+            help=_('Repository, to build the indexes for, if not provided all repositories are indexed.')
+        )
+        parser.add_argument(
+            '--snapshot',
+            type=str,
+            help=_('Snapshot id, if not provided all snapshots of the repository are indexed.')
+        )
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help=_('Drop the indexes instead of building them.')
+        )
+
+    def handle(self, *args, **options):
+        if snapshot_index.index_root() is None:
+            raise CommandError(_('You need to set SNAPSHOT_INDEX_PATH in localsettings.py to enable snapshot indexes'))
+
+        if options['repo']:
+            try:
+                repos = [Repository.objects.get(name=options['repo'])]
+            except Repository.DoesNotExist:
+                raise CommandError(_('Repository does not exist: {}'.format(options['repo'])))
+        elif options['snapshot']:
+            raise CommandError(_('--snapshot requires --repo'))
+        else:
+            repos = Repository.objects.all()
+
+        for repo in repos:
+            if options['drop']:
+                count = snapshot_index.drop(repo, options['snapshot'])
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        '%s "%s": %d' % (_('Dropped indexes of repository'), repo.name, count)
+                    )
+                )
+            elif options['snapshot']:
+                self.build_index(repo, options['snapshot'])
+            else:
+                for snapshot_id in self.snapshot_ids(repo):
+                    self.build_index(repo, snapshot_id)
+
+    def snapshot_ids(self, repo):
+        command = ['restic', '-r', repo.path, 'snapshots', '--json']
+        result = restic_command(repo, command)
+        try:
+            return [snap.id for snap in parse_snapshots(result.stdout)]
+        except json.JSONDecodeError:
+            self.stdout.write(self.style.ERROR(result.stderr.decode()))
+            return []
+
+    def build_index(self, repo, snapshot_id):
+        if snapshot_index.find(repo, snapshot_id) is not None:
+            return
+        t0 = time.time()
+        self.stdout.write(
+            self.style.SUCCESS(
+                '%s %s "%s" ...' % (_('Indexing snapshot'), snapshot_id[:8], repo.name)
+            )
+        )
+        if snapshot_index.build(repo, snapshot_id) is None:
+            self.stdout.write(self.style.ERROR(_('restic ls failed')))
+        else:
+            t1 = time.time()
+            self.stdout.write(
+                self.style.SUCCESS(
+                    _('done in %.2f seconds') % (t1 - t0)
+                )
+            )
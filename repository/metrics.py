@@ -0,0 +1,161 @@
+"""
+Metrics of the restic invocations of this process.
+
+Every restic process is measured: duration, exit code, bytes written to
+stdout and stderr and the peak resident set size (from os.wait4). The
+values are aggregated per restic command and repository in counters and
+histograms and rendered in the Prometheus text format at /metrics.
+Streams stopped on purpose (e.g. a directory listing which has seen all
+it needs) are counted with the exit code "killed", not as failures.
+
+The metrics live in the memory of each process, with several worker
+processes every scrape sees the worker which answered it.
+"""
+import hmac
+import math
+import os
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600, math.inf)
+RSS_BUCKETS = tuple(1 << shift for shift in range(24, 33)) + (math.inf,)
+
+HELP = {
+    'restic_commands_total': ('counter', 'restic invocations by exit code, "killed" if stopped on purpose.'),
+    'restic_command_duration_seconds': ('histogram', 'Wall time of restic invocations.'),
+    'restic_command_max_rss_bytes': ('histogram', 'Peak resident set size of restic invocations.'),
+    'restic_command_stdout_bytes_total': ('counter', 'Bytes restic wrote to stdout.'),
+    'restic_command_stderr_bytes_total': ('counter', 'Bytes restic wrote to stderr.'),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+# called with (name, duration) after every invocation, see repository/profiling.py
+listeners = []
+
+
+class Popen(subprocess.Popen):
+    """Popen which keeps the resource usage of the process once it is reaped."""
+
+    rusage = None
+
+    def _try_wait(self, wait_flags):
+        try:
+            pid, sts, rusage = os.wait4(self.pid, wait_flags)
+        except ChildProcessError:
+            # reaped elsewhere, like subprocess.Popen
+            return self.pid, 0
+        if pid == self.pid:
+            self.rusage = rusage
+        return pid, sts
+
+
+def max_rss(rusage):
+    # ru_maxrss is in kilobytes on Linux
+    return rusage.ru_maxrss * 1024 if rusage is not None else None
+
+
+def run(repo, name, command, env, timeout=None):
+    """
+    subprocess.run(command, capture_output=True) which records the
+    invocation under the restic command `name`.
+    """
+    start = time.monotonic()
+    with Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            observe(repo, name, time.monotonic() - start, process.returncode, 0, 0, process.rusage)
+            raise
+    observe(repo, name, time.monotonic() - start, process.returncode, len(stdout), len(stderr), process.rusage)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+
+def observe(repo, name, duration, returncode, stdout_bytes, stderr_bytes, rusage=None):
+    labels = (('command', name or ''), ('repo', repo.name))
+    with _lock:
+        increment('restic_commands_total', labels + (('code', str(returncode)),))
+        increment('restic_command_stdout_bytes_total', labels, stdout_bytes)
+        increment('restic_command_stderr_bytes_total', labels, stderr_bytes)
+        record('restic_command_duration_seconds', labels, duration, DURATION_BUCKETS)
+        rss = max_rss(rusage)
+        if rss is not None:
+            record('restic_command_max_rss_bytes', labels, rss, RSS_BUCKETS)
+    for listener in listeners:
+        listener(name, duration)
+
+
+def increment(name, labels, value=1):
+    key = (name, labels)
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def record(name, labels, value, buckets):
+    key = (name, labels)
+    if key not in _histograms:
+        _histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0, 'count': 0}
+    histogram = _histograms[key]
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            histogram['counts'][i] += 1
+    histogram['sum'] += value
+    histogram['count'] += 1
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    return '{' + ','.join('{}="{}"'.format(name, escape(value)) for name, value in labels) + '}'
+
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render():
+    """The metrics in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: dict(value, counts=list(value['counts'])) for key, value in _histograms.items()}
+
+    lines = []
+    for name, (metric_type, help_text) in HELP.items():
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} {}'.format(name, metric_type))
+        for (key_name, labels), value in sorted(counters.items()):
+            if key_name == name:
+                lines.append('{}{} {}'.format(name, format_labels(labels), format_value(value)))
+        for (key_name, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+            if key_name != name:
+                continue
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                bucket_labels = labels + (('le', format_value(bound)),)
+                lines.append('{}_bucket{} {}'.format(name, format_labels(bucket_labels), count))
+            lines.append('{}_sum{} {}'.format(name, format_labels(labels), format_value(histogram['sum'])))
+            lines.append('{}_count{} {}'.format(name, format_labels(labels), histogram['count']))
+    return '\n'.join(lines) + '\n'
+
+
+def is_authorized(request):
+    """Staff users, or a scraper sending `Authorization: Bearer <METRICS_TOKEN>`."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), 'Bearer ' + token):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
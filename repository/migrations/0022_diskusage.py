@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0021_merge_20221231_1209'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiskUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(auto_now_add=True, verbose_name='Timestamp')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('repo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='repository.repository', verbose_name='Repository')),
+            ],
+            options={
+                'verbose_name': 'Disk usage',
+                'verbose_name_plural': 'Disk usages',
+                'ordering': ['timestamp'],
+                'get_latest_by': 'timestamp',
+            },
+        ),
+    ]
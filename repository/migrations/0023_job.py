@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0022_diskusage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journal',
+            name='success',
+            field=models.BooleanField(default=True, verbose_name='Success'),
+        ),
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('1', 'Backup'), ('2', 'Download'), ('3', 'Restore'), ('4', 'New Repository'), ('5', 'Repository changed')], max_length=2, verbose_name='Action')),
+                ('data', models.CharField(max_length=200, verbose_name='Data')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Parameters')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10, verbose_name='Status')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='Started')),
+                ('ended', models.DateTimeField(blank=True, null=True, verbose_name='Ended')),
+                ('returncode', models.IntegerField(blank=True, null=True, verbose_name='Exit code')),
+                ('output', models.TextField(blank=True, verbose_name='Output')),
+                ('repo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='repository.repository', verbose_name='Repository')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Job',
+                'verbose_name_plural': 'Jobs',
+                'ordering': ['-created'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0024_job_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reposize',
+            name='state',
+            field=models.CharField(blank=True, default='', max_length=64, verbose_name='State'),
+        ),
+    ]
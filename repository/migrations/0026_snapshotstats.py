@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0025_reposize_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reposize',
+            name='raw_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Raw size'),
+        ),
+        migrations.CreateModel(
+            name='SnapshotStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_id', models.CharField(max_length=64, verbose_name='Snapshot')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('file_count', models.PositiveBigIntegerField(verbose_name='File count')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('repo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='repository.repository', verbose_name='Repository')),
+            ],
+            options={
+                'verbose_name': 'Snapshot statistics',
+                'verbose_name_plural': 'Snapshot statistics',
+                'constraints': [models.UniqueConstraint(fields=('repo', 'snapshot_id'), name='unique_snapshot_stats')],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0026_snapshotstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepoSizeDaily',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(verbose_name='Timestamp')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('file_count', models.PositiveBigIntegerField(verbose_name='File count')),
+                ('raw_size', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Raw size')),
+                ('samples', models.PositiveIntegerField(default=1, verbose_name='Samples')),
+            ],
+            options={
+                'verbose_name': 'Daily repository size',
+                'verbose_name_plural': 'Daily repository sizes',
+                'ordering': ['timestamp'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='RepoSizeHourly',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(verbose_name='Timestamp')),
+                ('size', models.PositiveBigIntegerField(verbose_name='Size')),
+                ('file_count', models.PositiveBigIntegerField(verbose_name='File count')),
+                ('raw_size', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Raw size')),
+                ('samples', models.PositiveIntegerField(default=1, verbose_name='Samples')),
+            ],
+            options={
+                'verbose_name': 'Hourly repository size',
+                'verbose_name_plural': 'Hourly repository sizes',
+                'ordering': ['timestamp'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reposize',
+            index=models.Index(fields=['repo', 'timestamp'], name='reposize_repo_timestamp'),
+        ),
+        migrations.AddField(
+            model_name='reposizedaily',
+            name='repo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='repository.repository', verbose_name='Repository'),
+        ),
+        migrations.AddField(
+            model_name='reposizehourly',
+            name='repo',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='repository.repository', verbose_name='Repository'),
+        ),
+        migrations.AddConstraint(
+            model_name='reposizedaily',
+            constraint=models.UniqueConstraint(fields=('repo', 'timestamp'), name='unique_reposize_daily'),
+        ),
+        migrations.AddConstraint(
+            model_name='reposizehourly',
+            constraint=models.UniqueConstraint(fields=('repo', 'timestamp'), name='unique_reposize_hourly'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0027_reposize_rollups'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='CallStack',
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0028_delete_callstack'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotDiff',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=64, verbose_name='Source snapshot')),
+                ('target', models.CharField(max_length=64, verbose_name='Target snapshot')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('done', 'Done')], default='running', max_length=10, verbose_name='Status')),
+                ('directories', models.JSONField(blank=True, default=list, verbose_name='Directories')),
+                ('changes', models.JSONField(blank=True, default=list, verbose_name='Changes')),
+                ('change_count', models.PositiveIntegerField(default=0, verbose_name='Change count')),
+                ('statistics', models.JSONField(blank=True, default=dict, verbose_name='Statistics')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('ended', models.DateTimeField(blank=True, null=True, verbose_name='Ended')),
+                ('repo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='repository.repository', verbose_name='Repository')),
+            ],
+            options={
+                'verbose_name': 'Snapshot diff',
+                'verbose_name_plural': 'Snapshot diffs',
+                'constraints': [models.UniqueConstraint(fields=('repo', 'source', 'target'), name='unique_snapshot_diff')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0029_snapshotdiff'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='journal',
+            options={'ordering': ['-timestamp', '-id'], 'verbose_name': 'Journal'},
+        ),
+        migrations.AddIndex(
+            model_name='journal',
+            index=models.Index(fields=['timestamp', 'id'], name='journal_timestamp_id'),
+        ),
+        migrations.AddIndex(
+            model_name='journal',
+            index=models.Index(fields=['repo', 'timestamp', 'id'], name='journal_repo_timestamp_id'),
+        ),
+        migrations.AddIndex(
+            model_name='journal',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='journal_user_timestamp_id'),
+        ),
+        migrations.AddIndex(
+            model_name='journal',
+            index=models.Index(fields=['action', 'timestamp', 'id'], name='journal_action_timestamp_id'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0031_job_worker'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='action',
+            field=models.CharField(choices=[('1', 'Backup'), ('2', 'Download'), ('3', 'Restore'), ('4', 'New Repository'), ('5', 'Repository changed'), ('6', 'Snapshot diff')], max_length=2, verbose_name='Action'),
+        ),
+        migrations.AlterField(
+            model_name='journal',
+            name='action',
+            field=models.CharField(choices=[('1', 'Backup'), ('2', 'Download'), ('3', 'Restore'), ('4', 'New Repository'), ('5', 'Repository changed'), ('6', 'Snapshot diff')], max_length=2, verbose_name='Action'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0032_snapshot_diff_action'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='diskusage',
+            index=models.Index(fields=['repo', 'timestamp'], name='diskusage_repo_timestamp'),
+        ),
+    ]
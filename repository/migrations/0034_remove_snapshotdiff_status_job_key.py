@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('repository', '0033_diskusage_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='snapshotdiff',
+            name='status',
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='key',
+            field=models.CharField(blank=True, max_length=200, verbose_name='Key'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(models.Q(('key', ''), _negated=True), ('status__in', ['queued', 'running'])), fields=('key',), name='unique_pending_job_key'),
+        ),
+    ]
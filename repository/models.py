@@ -32,19 +32,6 @@ class Repository(models.Model):
     )
 
 
-class CallStack(models.Model):
-
-    class Meta:
-        ordering = ['level']
-
-    def __str__(self):
-        return f'{self.level} {self.name}'
-
-    level = models.PositiveIntegerField(default=0, unique=True)
-    name = models.CharField(max_length=100)
-    path = models.CharField(max_length=200)
-
-
 class FileType(models.Model):
 
     class Meta:
@@ -80,6 +67,7 @@ ACTION_CHOICES = (
     ('3', _('Restore')),
     ('4', _('New Repository')),
     ('5', _('Repository changed')),
+    ('6', _('Snapshot diff')),
 )
 
 
@@ -87,7 +75,14 @@ class Journal(models.Model):
 
     class Meta:
         verbose_name = _('Journal')
-        ordering = ['-timestamp']
+        ordering = ['-timestamp', '-id']
+        # keyset pagination on (timestamp, id), alone or within a filter
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='journal_timestamp_id'),
+            models.Index(fields=['repo', 'timestamp', 'id'], name='journal_repo_timestamp_id'),
+            models.Index(fields=['user', 'timestamp', 'id'], name='journal_user_timestamp_id'),
+            models.Index(fields=['action', 'timestamp', 'id'], name='journal_action_timestamp_id'),
+        ]
 
     def __str__(self):
         return f'{self.timestamp} {self.repo}'
@@ -97,6 +92,7 @@ class Journal(models.Model):
     action = models.CharField(max_length=2, choices=ACTION_CHOICES, verbose_name=_('Action'))
     repo = models.ForeignKey(Repository, on_delete=models.DO_NOTHING, verbose_name=_('Repository'))
     data = models.CharField(max_length=200, verbose_name=_('Data'))
+    success = models.BooleanField(default=True, verbose_name=_('Success'))
 
 
 class RepoSize(models.Model):
@@ -105,6 +101,9 @@ class RepoSize(models.Model):
         verbose_name = _('Repository Size')
         verbose_name_plural = _('Repository Sizes')
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['repo', 'timestamp'], name='reposize_repo_timestamp'),
+        ]
 
     def __str__(self):
         return f'{self.timestamp} {self.repo}'
@@ -113,3 +112,168 @@ class RepoSize(models.Model):
     size = models.PositiveBigIntegerField(verbose_name=_('Size'))
     file_count = models.PositiveBigIntegerField(verbose_name=_('File count'))
     repo = models.ForeignKey(Repository, on_delete=models.CASCADE, verbose_name=_('Repository'))
+    # deduplicated size of the data in the repository (restic stats --mode raw-data)
+    raw_size = models.PositiveBigIntegerField(null=True, blank=True, verbose_name=_('Raw size'))
+    # fingerprint of the snapshot ids at the time of the sample
+    state = models.CharField(max_length=64, blank=True, default='', verbose_name=_('State'))
+
+
+class RepoSizeRollup(models.Model):
+    """Average of the RepoSize samples of a time bucket starting at `timestamp`."""
+
+    class Meta:
+        abstract = True
+        ordering = ['timestamp']
+
+    def __str__(self):
+        return f'{self.timestamp} {self.repo}'
+
+    timestamp = models.DateTimeField(verbose_name=_('Timestamp'))
+    size = models.PositiveBigIntegerField(verbose_name=_('Size'))
+    file_count = models.PositiveBigIntegerField(verbose_name=_('File count'))
+    raw_size = models.PositiveBigIntegerField(null=True, blank=True, verbose_name=_('Raw size'))
+    samples = models.PositiveIntegerField(default=1, verbose_name=_('Samples'))
+    repo = models.ForeignKey(Repository, on_delete=models.CASCADE, verbose_name=_('Repository'))
+
+
+class RepoSizeHourly(RepoSizeRollup):
+
+    class Meta(RepoSizeRollup.Meta):
+        verbose_name = _('Hourly repository size')
+        verbose_name_plural = _('Hourly repository sizes')
+        constraints = [
+            models.UniqueConstraint(fields=['repo', 'timestamp'], name='unique_reposize_hourly'),
+        ]
+
+
+class RepoSizeDaily(RepoSizeRollup):
+
+    class Meta(RepoSizeRollup.Meta):
+        verbose_name = _('Daily repository size')
+        verbose_name_plural = _('Daily repository sizes')
+        constraints = [
+            models.UniqueConstraint(fields=['repo', 'timestamp'], name='unique_reposize_daily'),
+        ]
+
+
+class SnapshotStats(models.Model):
+    """Restore size of a single snapshot, snapshots never change."""
+
+    class Meta:
+        verbose_name = _('Snapshot statistics')
+        verbose_name_plural = _('Snapshot statistics')
+        constraints = [
+            models.UniqueConstraint(fields=['repo', 'snapshot_id'], name='unique_snapshot_stats'),
+        ]
+
+    def __str__(self):
+        return f'{self.repo} {self.snapshot_id[:8]}'
+
+    repo = models.ForeignKey(Repository, on_delete=models.CASCADE, verbose_name=_('Repository'))
+    snapshot_id = models.CharField(max_length=64, verbose_name=_('Snapshot'))
+    size = models.PositiveBigIntegerField(verbose_name=_('Size'))
+    file_count = models.PositiveBigIntegerField(verbose_name=_('File count'))
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_('Created'))
+
+
+class SnapshotDiff(models.Model):
+    """
+    Result of `restic diff` between two snapshots, both sides never change.
+    Stored once the diff job is complete, the job shows the progress.
+    """
+
+    class Meta:
+        verbose_name = _('Snapshot diff')
+        verbose_name_plural = _('Snapshot diffs')
+        constraints = [
+            models.UniqueConstraint(fields=['repo', 'source', 'target'], name='unique_snapshot_diff'),
+        ]
+
+    def __str__(self):
+        return f'{self.repo} {self.source[:8]}..{self.target[:8]}'
+
+    repo = models.ForeignKey(Repository, on_delete=models.CASCADE, verbose_name=_('Repository'))
+    source = models.CharField(max_length=64, verbose_name=_('Source snapshot'))
+    target = models.CharField(max_length=64, verbose_name=_('Target snapshot'))
+    # counts and byte delta per directory below the backup paths
+    directories = models.JSONField(default=list, blank=True, verbose_name=_('Directories'))
+    # [modifier, path] pairs, at most DIFF_MAX_CHANGES
+    changes = models.JSONField(default=list, blank=True, verbose_name=_('Changes'))
+    change_count = models.PositiveIntegerField(default=0, verbose_name=_('Change count'))
+    # the statistics message of restic
+    statistics = models.JSONField(default=dict, blank=True, verbose_name=_('Statistics'))
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_('Created'))
+    ended = models.DateTimeField(null=True, blank=True, verbose_name=_('Ended'))
+
+    @property
+    def truncated(self):
+        return self.change_count > len(self.changes)
+
+
+class DiskUsage(models.Model):
+
+    class Meta:
+        verbose_name = _('Disk usage')
+        verbose_name_plural = _('Disk usages')
+        ordering = ['timestamp']
+        get_latest_by = 'timestamp'
+        # the latest sample of every repository is shown in the list
+        indexes = [
+            models.Index(fields=['repo', 'timestamp'], name='diskusage_repo_timestamp'),
+        ]
+
+    def __str__(self):
+        return f'{self.timestamp} {self.repo}'
+
+    timestamp = models.DateTimeField(auto_now_add=True, verbose_name=_('Timestamp'))
+    size = models.PositiveBigIntegerField(verbose_name=_('Size'))
+    repo = models.ForeignKey(Repository, on_delete=models.CASCADE, verbose_name=_('Repository'))
+
+
+JOB_STATUS_CHOICES = (
+    ('queued', _('Queued')),
+    ('running', _('Running')),
+    ('done', _('Done')),
+    ('failed', _('Failed')),
+)
+
+
+class Job(models.Model):
+
+    class Meta:
+        verbose_name = _('Job')
+        verbose_name_plural = _('Jobs')
+        ordering = ['-created']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'], condition=~models.Q(key='') & models.Q(status__in=['queued', 'running']),
+                name='unique_pending_job_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.created} {self.get_action_display()} {self.repo}'
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    user = models.ForeignKey(User, verbose_name=_('User'), on_delete=models.CASCADE)
+    repo = models.ForeignKey(Repository, on_delete=models.CASCADE, verbose_name=_('Repository'))
+    action = models.CharField(max_length=2, choices=ACTION_CHOICES, verbose_name=_('Action'))
+    data = models.CharField(max_length=200, verbose_name=_('Data'))
+    params = models.JSONField(default=dict, blank=True, verbose_name=_('Parameters'))
+    status = models.CharField(
+        max_length=10, choices=JOB_STATUS_CHOICES, default='queued', verbose_name=_('Status')
+    )
+    created = models.DateTimeField(auto_now_add=True, verbose_name=_('Created'))
+    started = models.DateTimeField(null=True, blank=True, verbose_name=_('Started'))
+    ended = models.DateTimeField(null=True, blank=True, verbose_name=_('Ended'))
+    returncode = models.IntegerField(null=True, blank=True, verbose_name=_('Exit code'))
+    output = models.TextField(blank=True, verbose_name=_('Output'))
+    progress = models.JSONField(default=dict, blank=True, verbose_name=_('Progress'))
+    # "<host>:<pid>" of the worker running the job and its last sign of life
+    worker = models.CharField(max_length=100, blank=True, verbose_name=_('Worker'))
+    heartbeat = models.DateTimeField(null=True, blank=True, verbose_name=_('Heartbeat'))
+    # of the queued and running jobs only one may have the same key
+    key = models.CharField(max_length=200, blank=True, verbose_name=_('Key'))
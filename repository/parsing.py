@@ -0,0 +1,100 @@
+"""
+Record types for the JSON output of restic.
+
+The records use __slots__ instead of a dict per object, so a listing
+with a few 100k nodes stays small, and timestamps are only parsed when
+a template actually asks for them. When orjson is installed it is used
+to decode the output, otherwise the json module of the standard library.
+
+Run benchmarks/parsing.py to compare with plain json.loads and SimpleNamespace.
+"""
+import json
+from datetime import datetime
+
+from dateutil.parser import parse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def parse_time(value):
+    """Parses the RFC 3339 timestamps of restic (with nanoseconds)."""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        # Python < 3.11 neither knows "Z" nor more than 6 fractional digits
+        return parse(value)
+
+
+class Record:
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+
+    @classmethod
+    def from_dict(cls, data):
+        obj = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(obj, name, data.get(name))
+        return obj
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__, getattr(self, 'path', None) or getattr(self, 'id', None))
+
+
+class Snapshot(Record):
+    __slots__ = (
+        'id', 'short_id', 'time', 'tree', 'paths', 'hostname', 'username',
+        'uid', 'gid', 'tags', 'parent', 'excludes', 'program_version', '_timestamp',
+    )
+    struct_type = 'snapshot'
+
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            self._timestamp = parse_time(self.time)
+        return self._timestamp
+
+
+class Node(Record):
+    __slots__ = (
+        'name', 'type', 'path', 'uid', 'gid', 'size', 'mode',
+        'mtime', 'atime', 'ctime', '_modified',
+    )
+    struct_type = 'node'
+
+    @property
+    def modified(self):
+        if self._modified is None:
+            self._modified = parse_time(self.mtime)
+        return self._modified
+
+
+class Stats(Record):
+    __slots__ = (
+        'total_size', 'total_file_count', 'total_blob_count', 'snapshots_count',
+        'total_uncompressed_size', 'compression_ratio', 'compression_progress',
+        'compression_space_saving',
+    )
+
+
+def parse_snapshots(data):
+    """Parses the output of `restic snapshots --json`."""
+    return [Snapshot.from_dict(item) for item in loads(data) or []]
+
+
+def parse_stats(data):
+    """Parses the output of `restic stats --json`."""
+    return Stats.from_dict(loads(data))
@@ -0,0 +1,181 @@
+"""
+Timing breakdown of requests.
+
+TimingMiddleware measures per request the wall time of restic processes,
+the number and time of database queries and the time spent rendering
+templates. The values are sent as Server-Timing header (shown by the
+network tab of the browser) and logged as one JSON line to the
+`repository.timing` logger. It is enabled with REQUEST_TIMING = True.
+
+With REQUEST_PROFILE_PATH set, REQUEST_PROFILE_SAMPLE of the requests
+(a fraction, 1.0 for all) run under cProfile and the profiles of the
+REQUEST_PROFILE_TOP slowest ones are kept as .prof files, e.g. for
+
+    python -m pstats /path/to/profiles/1234ms-....prof
+
+Times of streaming responses end when the streaming starts.
+"""
+import contextlib
+import cProfile
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.text import slugify
+
+from repository import metrics
+
+logger = logging.getLogger('repository.timing')
+
+_local = threading.local()
+# only one profiler can be active at a time
+_profile_lock = threading.Lock()
+
+
+def profile_path():
+    return getattr(settings, 'REQUEST_PROFILE_PATH', None)
+
+
+def profile_sample():
+    return getattr(settings, 'REQUEST_PROFILE_SAMPLE', 0.1)
+
+
+def profile_top():
+    return getattr(settings, 'REQUEST_PROFILE_TOP', 20)
+
+
+class Timing:
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = 0
+        self.restic_calls = 0
+        self.restic_time = 0
+        self.queries = 0
+        self.query_time = 0
+        self.render_start = None
+        self.render_time = 0
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_time += time.perf_counter() - start
+
+    def header(self):
+        entries = [
+            ('restic', self.restic_time, '{} restic'.format(self.restic_calls)),
+            ('db', self.query_time, '{} queries'.format(self.queries)),
+            ('tpl', self.render_time, 'templates'),
+            ('total', self.total, 'total'),
+        ]
+        return ', '.join(
+            '{};dur={:.1f};desc="{}"'.format(name, seconds * 1000, description)
+            for name, seconds, description in entries
+        )
+
+    def as_dict(self):
+        return {
+            'total_ms': round(self.total * 1000, 1),
+            'restic_calls': self.restic_calls,
+            'restic_ms': round(self.restic_time * 1000, 1),
+            'queries': self.queries,
+            'query_ms': round(self.query_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+        }
+
+
+def restic_listener(name, duration):
+    timing = getattr(_local, 'timing', None)
+    if timing is not None:
+        timing.restic_calls += 1
+        timing.restic_time += duration
+
+
+def profile_files():
+    return glob.glob(os.path.join(profile_path(), '*ms-*.prof'))
+
+
+def duration_of(profile_file):
+    return int(os.path.basename(profile_file).split('ms-', 1)[0])
+
+
+def save_profile(profiler, request, timing):
+    """Keeps the profile if it is among the REQUEST_PROFILE_TOP slowest."""
+    milliseconds = int(timing.total * 1000)
+    files = sorted(profile_files(), key=duration_of)
+    if len(files) >= profile_top() and files and duration_of(files[0]) >= milliseconds:
+        return
+    os.makedirs(profile_path(), exist_ok=True)
+    name = '{}ms-{}-{}-{}.prof'.format(
+        milliseconds, int(time.time()), request.method, slugify(request.path)[:80] or 'root'
+    )
+    profiler.dump_stats(os.path.join(profile_path(), name))
+    # the fastest ones make room
+    for profile_file in sorted(profile_files(), key=duration_of)[:-profile_top() or None]:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(profile_file)
+
+
+class TimingMiddleware:
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if restic_listener not in metrics.listeners:
+            metrics.listeners.append(restic_listener)
+
+    def __call__(self, request):
+        timing = Timing()
+        _local.timing = timing
+        profiler = None
+        if profile_path() and random.random() < profile_sample() and _profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        try:
+            with contextlib.ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.execute))
+                if profiler is not None:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler is not None:
+                        profiler.disable()
+        finally:
+            _local.timing = None
+            timing.total = time.perf_counter() - timing.start
+            if profiler is not None:
+                try:
+                    save_profile(profiler, request, timing)
+                finally:
+                    _profile_lock.release()
+
+        response['Server-Timing'] = timing.header()
+        logger.info(json.dumps(dict(
+            timing.as_dict(), method=request.method, path=request.path, status=response.status_code,
+        )))
+        return response
+
+    def process_template_response(self, request, response):
+        # called right before the response is rendered
+        timing = getattr(_local, 'timing', None)
+        if timing is not None:
+            timing.render_start = time.perf_counter()
+            response.add_post_render_callback(self.rendered)
+        return response
+
+    def rendered(self, response):
+        timing = getattr(_local, 'timing', None)
+        if timing is not None and timing.render_start is not None:
+            timing.render_time += time.perf_counter() - timing.render_start
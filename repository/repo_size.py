@@ -0,0 +1,95 @@
+"""
+Samples the size of repositories.
+
+`restic stats` in its default restore-size mode walks the trees of all
+snapshots, so it gets slower with every backup. Snapshots never change,
+the stats of every snapshot are therefore stored once as SnapshotStats
+and a sample only asks restic about snapshots it has not seen before.
+Stats of forgotten snapshots are removed. The deduplicated size comes
+from the raw-data mode. It walks the trees of all snapshots as well, to
+find the blobs in use, so it is only part of a sample when asked for
+(log_size --raw-size), e.g. once a day, never after a backup.
+
+A `timeout` applies to a repository as a whole: all restic commands of a
+sample, including their waits for a slot of the governor, share one
+deadline.
+"""
+import hashlib
+
+from django.db.models import Sum
+
+from repository.models import RepoSize, SnapshotStats
+from repository.parsing import parse_stats
+from repository.restic import Deadline, restic_command
+
+
+def run_restic(repo, command, deadline=None):
+    timeout = deadline.remaining(command) if deadline is not None else None
+    result = restic_command(repo, command, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode().strip() or 'restic {} failed'.format(command[3]))
+    return result
+
+
+def snapshot_ids(repo, deadline=None):
+    """`restic list snapshots` only lists the snapshot files, no trees are read."""
+    command = ['restic', '-r', repo.path, 'list', 'snapshots']
+    return sorted(run_restic(repo, command, deadline).stdout.decode().split())
+
+
+def state_of(ids):
+    """Fingerprint of the snapshot ids of a repository."""
+    return hashlib.sha256('\n'.join(sorted(ids)).encode()).hexdigest()
+
+
+def update_snapshot_stats(repo, ids, deadline=None):
+    """
+    Stores the restore size of the snapshots in `ids` which have no stats
+    yet and removes the stats of forgotten snapshots. Returns the number
+    of snapshots restic had to walk.
+    """
+    SnapshotStats.objects.filter(repo=repo).exclude(snapshot_id__in=ids).delete()
+    known = set(SnapshotStats.objects.filter(repo=repo).values_list('snapshot_id', flat=True))
+    new_ids = [snapshot_id for snapshot_id in ids if snapshot_id not in known]
+    for snapshot_id in new_ids:
+        command = ['restic', '-r', repo.path, 'stats', snapshot_id, '--json']
+        stats = parse_stats(run_restic(repo, command, deadline).stdout)
+        # get_or_create, a backup job may sample the same repository right now
+        SnapshotStats.objects.get_or_create(
+            repo=repo,
+            snapshot_id=snapshot_id,
+            defaults={'size': stats.total_size, 'file_count': stats.total_file_count},
+        )
+    return len(new_ids)
+
+
+def raw_size(repo, deadline=None):
+    """Deduplicated size of the repository, restic walks the trees of all snapshots for it."""
+    command = ['restic', '-r', repo.path, 'stats', '--mode', 'raw-data', '--json']
+    return parse_stats(run_restic(repo, command, deadline).stdout).total_size
+
+
+def LogRepoSize(repo, timeout=None, skip_unchanged=False, with_raw_size=False):
+    """
+    Records the size of `repo`. With `skip_unchanged` nothing is recorded
+    (and None returned) if the snapshots have not changed since the last sample.
+    The deduplicated size is only determined `with_raw_size`.
+    Raises subprocess.TimeoutExpired if it takes longer than `timeout` seconds.
+    """
+    deadline = Deadline(timeout)
+    ids = snapshot_ids(repo, deadline)
+    state = state_of(ids)
+    if skip_unchanged:
+        last = RepoSize.objects.filter(repo=repo).order_by('-timestamp').first()
+        if last is not None and last.state == state:
+            return None
+
+    update_snapshot_stats(repo, ids, deadline)
+    totals = SnapshotStats.objects.filter(repo=repo).aggregate(size=Sum('size'), file_count=Sum('file_count'))
+    return RepoSize.objects.create(
+        repo=repo,
+        size=totals['size'] or 0,
+        file_count=totals['file_count'] or 0,
+        raw_size=raw_size(repo, deadline) if with_raw_size else None,
+        state=state,
+    )
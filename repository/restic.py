@@ -0,0 +1,221 @@
+import contextlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+
+from repository import governor, metrics
+from repository.parsing import loads, Snapshot, Node
+
+CHUNK_SIZE = 64 * 1024
+
+
+def cache_dir(repo):
+    """The restic cache of `repo` if RESTIC_CACHE_PATH is set, see repository/restic_cache.py"""
+    cache_path = getattr(settings, 'RESTIC_CACHE_PATH', None)
+    if cache_path is None:
+        return None
+    return os.path.join(cache_path, str(repo.pk))
+
+
+def restic_env(repo):
+    my_env = os.environ.copy()
+    my_env["RESTIC_PASSWORD"] = repo.password
+    # same as --cache-dir, extra_keys may still point it elsewhere
+    if cache_dir(repo) is not None:
+        my_env["RESTIC_CACHE_DIR"] = cache_dir(repo)
+    for key, value in repo.extra_keys.items():
+        my_env[key] = value
+    return my_env
+
+
+class Deadline:
+    """
+    A time limit shared by several restic commands, e.g. all commands
+    for one repository. remaining() raises TimeoutExpired once it has passed.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+        self.end = None if timeout is None else time.monotonic() + timeout
+
+    def remaining(self, command):
+        """Seconds left for `command`, None without a limit."""
+        if self.end is None:
+            return None
+        left = self.end - time.monotonic()
+        if left <= 0:
+            raise subprocess.TimeoutExpired(command, self.timeout)
+        return left
+
+
+def restic_command(repo, command, timeout=None, governed=True):
+    my_env = restic_env(repo)
+
+    if settings.DEBUG:
+        print('Issue restic_command: "%s"' % command)
+    # return subprocess.run(command, stdout=subprocess.PIPE, env=my_env, capture_output=True)
+
+    # Capture stderr so we can later display usefull messages in case of error
+    # capture_output=True requires Python 3.7 or higher
+    # `timeout` covers the wait for a slot, retries and restic itself,
+    # restic is killed and TimeoutExpired raised when it has passed.
+    # Interactive reads (governed=False) start at once, like ResticStream
+    deadline = Deadline(timeout)
+    retries = getattr(settings, 'RESTIC_LOCK_RETRIES', 3)
+    for attempt in range(retries + 1):
+        slot = governor.slot(repo, command, deadline.remaining(command)) if governed else contextlib.nullcontext()
+        with slot:
+            governor.wait_for_locks(repo, my_env, command, deadline.remaining(command))
+            result = metrics.run(
+                repo, governor.command_name(command), command, my_env, timeout=deadline.remaining(command)
+            )
+        if result.returncode == 0 or not governor.is_locked_error(result.stderr):
+            break
+        # locked by a process outside of the governor, queue up again
+        if attempt < retries:
+            pause = governor.LOCK_POLL_INTERVAL * (attempt + 1)
+            time.sleep(min(pause, deadline.remaining(command) or pause))
+    return result
+
+
+class ResticStream:
+    """
+    Runs a restic command with --json and yields the parsed lines
+    while restic is still running, so the output is never held in
+    memory as a whole. Leaving the loop early (or closing the stream)
+    kills restic, such a stream is `killed` and recorded with the exit
+    code "killed" instead of a failure. iter_bytes() yields the raw
+    output instead.
+    A `governed` stream waits for a slot of the governor and holds it
+    until it is closed, interactive reads (browsing, downloads) are not
+    governed.
+
+        with ResticStream(repo, command) as stream:
+            for item in stream:
+                ...
+        stream.returncode, stream.stderr
+    """
+
+    def __init__(self, repo, command, governed=False):
+        self.repo = repo
+        self.command = command
+        self._slot = None
+        self._stderr = None
+        self._start = time.monotonic()
+        self._stdout_bytes = 0
+        self.killed = False
+        self._eof = False
+        try:
+            if governed:
+                self._slot = governor.slot(repo, command)
+                self._slot.__enter__()
+                governor.wait_for_locks(repo, restic_env(repo), command)
+            # stderr goes to a file, a second pipe could block restic when it is never read
+            self._stderr = tempfile.TemporaryFile()
+            self.process = metrics.Popen(
+                command, env=restic_env(repo),
+                stdout=subprocess.PIPE, stderr=self._stderr,
+            )
+        except BaseException:
+            # nothing runs, give the slot back at once
+            if self._stderr is not None:
+                self._stderr.close()
+            if self._slot is not None:
+                self._slot.__exit__(None, None, None)
+                self._slot = None
+            raise
+        self.stderr = b''
+
+    def __iter__(self):
+        for line in self.process.stdout:
+            self._stdout_bytes += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = loads(line)
+            except json.JSONDecodeError:
+                # restic occasionally prints plain text, even with --json
+                continue
+            yield item
+        self._eof = True
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def iter_bytes(self, chunk_size=CHUNK_SIZE):
+        """Yields the raw output, e.g. of `restic dump`."""
+        try:
+            while True:
+                chunk = self.process.stdout.read1(chunk_size)
+                if not chunk:
+                    self._eof = True
+                    break
+                self._stdout_bytes += len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    @property
+    def returncode(self):
+        return self.process.returncode
+
+    def close(self):
+        # wait() instead of poll(), only wait() records the resource usage;
+        # after the end of its output restic is about to exit by itself
+        try:
+            self.process.wait(timeout=None if self._eof else 0)
+        except subprocess.TimeoutExpired:
+            # stopped on purpose, the output was not needed any more
+            self.killed = True
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+        if not self._stderr.closed:
+            self._stderr.seek(0)
+            self.stderr = self._stderr.read()
+            self._stderr.close()
+            metrics.observe(
+                self.repo, governor.command_name(self.command), time.monotonic() - self._start,
+                'killed' if self.killed else self.process.returncode, self._stdout_bytes, len(self.stderr), self.process.rusage,
+            )
+        if self._slot is not None:
+            self._slot.__exit__(None, None, None)
+            self._slot = None
+
+
+def list_directory(repo, snapshot_id, path):
+    """
+    Returns the snapshot, the node of `path` and the nodes directly beneath
+    `path`. Deeper nodes are dropped as they arrive and restic is stopped
+    as soon as its walk has left `path`.
+    """
+    path = '/' + path.strip('/') if path else '/'
+    prefix = path.rstrip('/') + '/'
+    snapshot, current, children = None, None, []
+
+    command = ['restic', '-r', repo.path, 'ls', snapshot_id, path, '--json']
+    with ResticStream(repo, command) as stream:
+        for item in stream:
+            struct_type = item.get('struct_type')
+            if struct_type == 'snapshot':
+                snapshot = Snapshot.from_dict(item)
+            elif struct_type == 'node':
+                node_path = item['path']
+                if node_path == path:
+                    current = Node.from_dict(item)
+                elif node_path.startswith(prefix):
+                    if '/' not in node_path[len(prefix):]:
+                        children.append(Node.from_dict(item))
+                elif current is not None:
+                    # restic walks the tree depth first, all children have been seen
+                    break
+    return snapshot, current, children
@@ -0,0 +1,77 @@
+"""
+Persistent restic caches, one per repository.
+
+restic keeps index and tree data of a repository in a local cache, by
+default beneath the home directory of the user running it. With
+RESTIC_CACHE_PATH set, every repository gets its own cache in
+RESTIC_CACHE_PATH/<repo id> (passed as RESTIC_CACHE_DIR, the environment
+variable of --cache-dir), so the caches survive an ephemeral home
+directory and their size can be reported per repository.
+
+The restic_cache management command reports the sizes, warms the caches
+after a deploy and cleans up caches restic no longer uses.
+"""
+import os
+import shutil
+
+import humanize
+from django.conf import settings
+
+from repository.disk_usage import cache_size_file, sample_cache, stored_cache_size
+from repository.models import Repository
+from repository.repo_size import run_restic
+from repository.restic import Deadline
+
+
+def cache_root():
+    return getattr(settings, 'RESTIC_CACHE_PATH', None)
+
+
+def size(repo):
+    """Measures the bytes in the cache of `repo`, None without RESTIC_CACHE_PATH."""
+    return sample_cache(repo)
+
+
+def size_label(repo):
+    """
+    The size of the cache of `repo` as shown on the snapshots page, from
+    the last sample of the disk usage sampler or the restic_cache command.
+    """
+    cache_size = stored_cache_size(repo)
+    if cache_size is None:
+        return None
+    return humanize.naturalsize(cache_size, binary=False)
+
+
+def warm(repo, timeout=None):
+    """
+    Loads the snapshots and the index of `repo` into its cache. Listing
+    the root of the latest snapshot needs the complete index but reads
+    only a single tree. `timeout` applies to both commands together.
+    """
+    deadline = Deadline(timeout)
+    run_restic(repo, ['restic', '-r', repo.path, 'snapshots', '--json'], deadline)
+    run_restic(repo, ['restic', '-r', repo.path, 'ls', 'latest', '/', '--json'], deadline)
+
+
+def cleanup(repo):
+    """Lets restic remove the data of repositories unused for 30 days from the cache of `repo`."""
+    run_restic(repo, ['restic', '-r', repo.path, 'cache', '--cleanup'])
+
+
+def remove_orphans():
+    """Removes the caches of deleted repositories, returns their number."""
+    root = cache_root()
+    if root is None or not os.path.isdir(root):
+        return 0
+    repo_ids = {str(pk) for pk in Repository.objects.values_list('pk', flat=True)}
+    removed = 0
+    for entry in os.scandir(root):
+        if entry.is_dir(follow_symlinks=False) and entry.name not in repo_ids:
+            shutil.rmtree(entry.path)
+            removed += 1
+            try:
+                os.remove(cache_size_file(Repository(pk=entry.name)))
+            except FileNotFoundError:
+                pass
+    return removed
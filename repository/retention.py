@@ -0,0 +1,113 @@
+"""
+Retention of the repository size samples.
+
+Raw RepoSize samples are kept for REPO_SIZE_RAW_DAYS, then averaged into
+RepoSizeHourly. Hourly rollups are kept for REPO_SIZE_HOURLY_DAYS, then
+averaged into RepoSizeDaily, which are kept forever. Every sample lives
+in exactly one tier, so the charts read all tiers and the number of rows
+per repository stays bounded no matter how long samples are collected.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from repository.models import RepoSize, RepoSizeHourly, RepoSizeDaily
+
+BATCH_SIZE = 1000
+
+
+def raw_days():
+    return getattr(settings, 'REPO_SIZE_RAW_DAYS', 30)
+
+
+def hourly_days():
+    return getattr(settings, 'REPO_SIZE_HOURLY_DAYS', 365)
+
+
+def samples_of(model):
+    """Number of raw samples behind the rows of `model`, for weighted averages."""
+    return Count('id') if model is RepoSize else Sum('samples')
+
+
+def bucket_timezone(kind):
+    """
+    Hours are cut in UTC, a local hour repeats when daylight saving time
+    ends. Days follow the current time zone like the charts.
+    """
+    return datetime.timezone.utc if kind == 'hour' else None
+
+
+def merge(old_avg, old_samples, new_avg, new_samples):
+    if old_avg is None:
+        return new_avg
+    if new_avg is None:
+        return old_avg
+    return round((old_avg * old_samples + new_avg * new_samples) / (old_samples + new_samples))
+
+
+def rollup(source, target, kind, cutoff):
+    """
+    Averages all rows of `source` before `cutoff` per `kind` (hour or day)
+    into `target` and deletes them. Returns the number of removed rows.
+    """
+    old = source.objects.filter(timestamp__lt=cutoff)
+    with transaction.atomic():
+        buckets = list(
+            old.annotate(bucket=Trunc('timestamp', kind, tzinfo=bucket_timezone(kind))).order_by().values('repo_id', 'bucket').annotate(
+                avg_size=Avg('size'), avg_file_count=Avg('file_count'),
+                avg_raw_size=Avg('raw_size'), sample_count=samples_of(source),
+            )
+        )
+        if not buckets:
+            return 0
+        # buckets are only complete before the cutoff, existing rollups are merged
+        existing = {
+            (rollup.repo_id, rollup.timestamp.astimezone(datetime.timezone.utc)): rollup
+            for rollup in target.objects.filter(
+                timestamp__gte=min(bucket['bucket'] for bucket in buckets), timestamp__lt=cutoff
+            )
+        }
+        created, updated = [], []
+        for bucket in buckets:
+            row = existing.get((bucket['repo_id'], bucket['bucket'].astimezone(datetime.timezone.utc)))
+            raw_size = bucket['avg_raw_size']
+            if raw_size is not None:
+                raw_size = round(raw_size)
+            if row is None:
+                created.append(target(
+                    repo_id=bucket['repo_id'],
+                    timestamp=bucket['bucket'],
+                    size=round(bucket['avg_size']),
+                    file_count=round(bucket['avg_file_count']),
+                    raw_size=raw_size,
+                    samples=bucket['sample_count'],
+                ))
+            else:
+                samples = bucket['sample_count']
+                row.size = merge(row.size, row.samples, bucket['avg_size'], samples)
+                row.file_count = merge(row.file_count, row.samples, bucket['avg_file_count'], samples)
+                row.raw_size = merge(row.raw_size, row.samples, raw_size, samples)
+                row.samples += samples
+                updated.append(row)
+        target.objects.bulk_create(created, batch_size=BATCH_SIZE)
+        target.objects.bulk_update(
+            updated, ['size', 'file_count', 'raw_size', 'samples'], batch_size=BATCH_SIZE
+        )
+        deleted, _rows = old.delete()
+    return deleted
+
+
+def compact(now=None):
+    """Applies the retention policy. Returns the removed raw and hourly rows."""
+    now = timezone.localtime(now)
+    hour_cutoff = (now - datetime.timedelta(days=raw_days())).replace(minute=0, second=0, microsecond=0)
+    day_cutoff = (now - datetime.timedelta(days=hourly_days())).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    raw = rollup(RepoSize, RepoSizeHourly, 'hour', hour_cutoff)
+    hourly = rollup(RepoSizeHourly, RepoSizeDaily, 'day', day_cutoff)
+    return raw, hourly
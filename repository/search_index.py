@@ -0,0 +1,232 @@
+"""
+Searchable index of the paths in all snapshots of a repository.
+
+Every path is stored once per repository, together with the snapshots
+it occurs in, in ``SEARCH_INDEX_PATH/<repo id>.sqlite3``. An FTS5 table
+with the trigram tokenizer answers substring searches on the paths
+without scanning them. Snapshots never change, so update() only lists
+the snapshots that are not indexed yet (from the snapshot index if
+there is one) and drops the forgotten ones.
+"""
+import datetime
+import json
+import os
+import sqlite3
+
+from django.conf import settings
+
+from repository import snapshot_index
+from repository.parsing import parse_snapshots, parse_time
+from repository.restic import ResticStream, restic_command
+
+BATCH_SIZE = 5000
+RESULT_LIMIT = 200
+
+# the trigram tokenizer needs SQLite 3.34, older versions fall back to LIKE
+TRIGRAM = sqlite3.sqlite_version_info >= (3, 34, 0)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot (
+    id INTEGER PRIMARY KEY,
+    snapshot_id TEXT UNIQUE NOT NULL,
+    short_id TEXT NOT NULL,
+    time TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS path (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    type TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS occurrence (
+    path_id INTEGER NOT NULL,
+    snapshot INTEGER NOT NULL,
+    PRIMARY KEY (path_id, snapshot)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS occurrence_snapshot ON occurrence (snapshot);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS path_fts USING fts5(
+    path, content='path', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS path_insert AFTER INSERT ON path BEGIN
+    INSERT INTO path_fts (rowid, path) VALUES (new.id, new.path);
+END;
+CREATE TRIGGER IF NOT EXISTS path_delete AFTER DELETE ON path BEGIN
+    INSERT INTO path_fts (path_fts, rowid, path) VALUES ('delete', old.id, old.path);
+END;
+"""
+
+
+def index_root():
+    return getattr(settings, 'SEARCH_INDEX_PATH', None)
+
+
+def index_file(repo):
+    return os.path.join(index_root(), '{}.sqlite3'.format(repo.pk))
+
+
+def connect(repo):
+    os.makedirs(index_root(), exist_ok=True)
+    con = sqlite3.connect(index_file(repo), timeout=60)
+    # searches keep working while a new snapshot is added
+    con.execute('PRAGMA journal_mode=WAL')
+    con.executescript(SCHEMA)
+    if TRIGRAM:
+        con.executescript(FTS_SCHEMA)
+    return con
+
+
+def snapshot_nodes(repo, snapshot_id):
+    """
+    Yields (path, type) of all nodes of the snapshot, from its snapshot
+    index if there is one, otherwise from restic. Raises RuntimeError if
+    restic failed.
+    """
+    index_path = snapshot_index.find(repo, snapshot_id)
+    if index_path is not None:
+        con = sqlite3.connect('file:{}?mode=ro'.format(index_path), uri=True)
+        try:
+            yield from con.execute('SELECT path, type FROM node')
+        finally:
+            con.close()
+        return
+
+    command = ['restic', '-r', repo.path, 'ls', '--recursive', snapshot_id, '--json']
+    with ResticStream(repo, command, governed=True) as stream:
+        for item in stream:
+            if item.get('struct_type') == 'node':
+                yield item['path'], item['type']
+    if stream.returncode != 0:
+        raise RuntimeError(stream.stderr.decode().strip() or 'restic ls failed')
+
+
+def add_snapshot(con, repo, snapshot):
+    """Indexes all paths of `snapshot` in a single transaction."""
+    with con:
+        cursor = con.execute(
+            'INSERT OR IGNORE INTO snapshot (snapshot_id, short_id, time) VALUES (?, ?, ?)',
+            (snapshot.id, snapshot.short_id, snapshot.timestamp.astimezone(datetime.timezone.utc).isoformat())
+        )
+        if cursor.rowcount == 0:
+            # indexed by a concurrent update
+            return
+        rowid = cursor.lastrowid
+        batch = []
+        for node in snapshot_nodes(repo, snapshot.id):
+            batch.append(node)
+            if len(batch) >= BATCH_SIZE:
+                insert_paths(con, rowid, batch)
+                batch = []
+        insert_paths(con, rowid, batch)
+
+
+def insert_paths(con, rowid, batch):
+    con.executemany('INSERT OR IGNORE INTO path (path, type) VALUES (?, ?)', batch)
+    con.executemany(
+        'INSERT OR IGNORE INTO occurrence (path_id, snapshot) SELECT id, ? FROM path WHERE path = ?',
+        [(rowid, path) for path, node_type in batch]
+    )
+
+
+def remove_snapshots(con, rowids):
+    with con:
+        for rowid in rowids:
+            con.execute('DELETE FROM occurrence WHERE snapshot = ?', (rowid,))
+            con.execute('DELETE FROM snapshot WHERE id = ?', (rowid,))
+        # paths which are in no snapshot anymore
+        con.execute('DELETE FROM path WHERE id NOT IN (SELECT path_id FROM occurrence)')
+
+
+def update(repo, snapshots=None):
+    """
+    Indexes the snapshots of `repo` which are new and removes the
+    forgotten ones. Returns the number of added and removed snapshots.
+    """
+    if index_root() is None:
+        return 0, 0
+    if snapshots is None:
+        result = restic_command(repo, ['restic', '-r', repo.path, 'snapshots', '--json'])
+        try:
+            snapshots = parse_snapshots(result.stdout)
+        except json.JSONDecodeError:
+            raise RuntimeError(result.stderr.decode().strip() or 'restic snapshots failed')
+
+    con = connect(repo)
+    try:
+        known = dict(con.execute('SELECT snapshot_id, id FROM snapshot'))
+        current = {snapshot.id for snapshot in snapshots}
+        forgotten = [rowid for snapshot_id, rowid in known.items() if snapshot_id not in current]
+        if forgotten:
+            remove_snapshots(con, forgotten)
+        added = 0
+        for snapshot in snapshots:
+            if snapshot.id not in known:
+                add_snapshot(con, repo, snapshot)
+                added += 1
+    finally:
+        con.close()
+    return added, len(forgotten)
+
+
+def exists(repo):
+    return index_root() is not None and os.path.exists(index_file(repo))
+
+
+def search(repo, query, limit=RESULT_LIMIT):
+    """
+    Returns up to `limit` paths containing `query` (case insensitive),
+    each with the snapshots it occurs in, newest first.
+    """
+    query = query.strip()
+    if not query or not exists(repo):
+        return []
+    con = sqlite3.connect('file:{}?mode=ro'.format(index_file(repo)), uri=True)
+    try:
+        if TRIGRAM and len(query) >= 3:
+            # a phrase of trigrams matches the query anywhere in the path
+            rows = con.execute(
+                'SELECT path.id, path.path, path.type FROM path_fts '
+                'JOIN path ON path.id = path_fts.rowid WHERE path_fts MATCH ? LIMIT ?',
+                ('"{}"'.format(query.replace('"', '""')), limit)
+            ).fetchall()
+        else:
+            pattern = '%{}%'.format(query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+            rows = con.execute(
+                "SELECT id, path, type FROM path WHERE path LIKE ? ESCAPE '\\' LIMIT ?",
+                (pattern, limit)
+            ).fetchall()
+
+        results = {
+            path_id: {
+                'path': path, 'name': os.path.basename(path), 'type': node_type, 'snapshots': [],
+                # files are shown in the directory containing them
+                'browse_path': path if node_type == 'dir' else os.path.dirname(path) or '/',
+            }
+            for path_id, path, node_type in rows
+        }
+        if results:
+            occurrences = con.execute(
+                'SELECT occurrence.path_id, snapshot.snapshot_id, snapshot.short_id, snapshot.time '
+                'FROM occurrence JOIN snapshot ON snapshot.id = occurrence.snapshot '
+                'WHERE occurrence.path_id IN ({}) ORDER BY snapshot.time DESC'.format(','.join('?' * len(results))),
+                list(results)
+            )
+            for path_id, snapshot_id, short_id, time in occurrences:
+                results[path_id]['snapshots'].append(
+                    {'id': snapshot_id, 'short_id': short_id, 'time': parse_time(time)}
+                )
+    finally:
+        con.close()
+    return sorted(results.values(), key=lambda result: result['path'])
+
+
+def drop(repo):
+    if not exists(repo):
+        return False
+    for suffix in ('', '-wal', '-shm'):
+        try:
+            os.remove(index_file(repo) + suffix)
+        except FileNotFoundError:
+            pass
+    return True
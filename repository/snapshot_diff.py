@@ -0,0 +1,163 @@
+"""
+Differences between two snapshots.
+
+`restic diff` has to walk both trees, so it runs as a Job (see
+repository/jobs.py) and the result of every snapshot pair is stored as
+SnapshotDiff once it is complete. Snapshots never change, the stored
+diff is therefore never outdated. The output of restic is parsed line
+by line while it is running, only the first DIFF_MAX_CHANGES changes
+are kept for display.
+
+restic reports no sizes, the byte delta per directory is computed from
+the sizes of the changed files in both snapshots (taken from the
+snapshot index if it is enabled, see repository/snapshot_index.py).
+"""
+import sqlite3
+
+from django.conf import settings
+from django.utils import timezone
+
+from repository import snapshot_index
+from repository.models import SnapshotDiff
+from repository.parsing import parse_snapshots
+from repository.restic import restic_command, ResticStream
+
+BATCH_SIZE = 500
+
+
+def max_changes():
+    return getattr(settings, 'DIFF_MAX_CHANGES', 10000)
+
+
+def snapshot_roots(repo, source, target):
+    command = ['restic', '-r', repo.path, 'snapshots', source, target, '--json']
+    result = restic_command(repo, command)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode().strip() or 'restic snapshots failed')
+    roots = set()
+    for snapshot in parse_snapshots(result.stdout):
+        roots.update(snapshot.paths or [])
+    # the longest root first, backup paths may be nested
+    return sorted(roots, key=len, reverse=True)
+
+
+def directory_of(path, roots):
+    """The entry directly beneath the backup path containing `path`."""
+    for root in roots:
+        prefix = root.rstrip('/') + '/'
+        if path.startswith(prefix):
+            return prefix + path[len(prefix):].split('/', 1)[0]
+        if path == root:
+            return root
+    return '/' + path.strip('/').split('/', 1)[0]
+
+
+def iter_changes(repo, source, target, statistics):
+    """
+    Yields the (modifier, path) changes from source to target while restic
+    is running and fills `statistics` with its summary.
+    """
+    command = ['restic', '-r', repo.path, 'diff', source, target, '--json']
+    with ResticStream(repo, command, governed=True) as stream:
+        for item in stream:
+            message_type = item.get('message_type')
+            if message_type == 'change':
+                yield item['modifier'], item['path']
+            elif message_type == 'statistics':
+                statistics.update(item)
+    if stream.returncode != 0:
+        raise RuntimeError(stream.stderr.decode().strip() or 'restic diff failed')
+
+
+def file_sizes(repo, snapshot_id, paths):
+    """Returns {path: size} of the files in `paths` within the snapshot."""
+    if not paths:
+        return {}
+    sizes = {}
+    index_path = snapshot_index.get_or_build(repo, snapshot_id)
+    if index_path is not None:
+        con = sqlite3.connect('file:{}?mode=ro'.format(index_path), uri=True)
+        try:
+            paths = list(paths)
+            for i in range(0, len(paths), BATCH_SIZE):
+                batch = paths[i:i + BATCH_SIZE]
+                rows = con.execute(
+                    "SELECT path, size FROM node WHERE type = 'file' AND path IN ({})".format(','.join('?' * len(batch))),
+                    batch
+                )
+                sizes.update(rows)
+        finally:
+            con.close()
+        return sizes
+
+    command = ['restic', '-r', repo.path, 'ls', '--recursive', snapshot_id, '--json']
+    with ResticStream(repo, command) as stream:
+        for item in stream:
+            if item.get('type') == 'file' and item.get('path') in paths:
+                sizes[item['path']] = item.get('size') or 0
+    return sizes
+
+
+def compute(repo, source, target):
+    """Runs restic diff and returns the fields of a SnapshotDiff."""
+    roots = snapshot_roots(repo, source, target)
+    statistics = {}
+    changes = []
+    change_count = 0
+    directories = {}
+    # files whose size is needed, from the source and the target snapshot
+    source_files, target_files = {}, {}
+    for modifier, path in iter_changes(repo, source, target, statistics):
+        change_count += 1
+        if len(changes) < max_changes():
+            changes.append([modifier, path])
+        # directories end with a slash, their size is the sum of their files
+        is_dir = path.endswith('/')
+        path = path.rstrip('/') or '/'
+        directory = directory_of(path, roots)
+        counts = directories.setdefault(directory, {
+            'path': directory, 'added': 0, 'removed': 0, 'modified': 0, 'delta': 0,
+        })
+        if modifier == '+':
+            counts['added'] += 1
+        elif modifier == '-':
+            counts['removed'] += 1
+        else:
+            counts['modified'] += 1
+        if is_dir:
+            continue
+        if modifier != '+':
+            source_files[path] = directory
+        if modifier != '-':
+            target_files[path] = directory
+
+    for path, size in file_sizes(repo, source, set(source_files)).items():
+        directories[source_files[path]]['delta'] -= size
+    for path, size in file_sizes(repo, target, set(target_files)).items():
+        directories[target_files[path]]['delta'] += size
+
+    return {
+        'directories': sorted(directories.values(), key=lambda counts: counts['path']),
+        'changes': changes,
+        'change_count': change_count,
+        'statistics': statistics,
+    }
+
+
+def find(repo, source, target):
+    """The stored SnapshotDiff of the snapshot pair or None."""
+    return SnapshotDiff.objects.filter(repo=repo, source=source, target=target).first()
+
+
+def store(repo, source, target):
+    """
+    Computes the diff of the snapshot pair and stores it, replacing the
+    result of a job which ran at the same time. Raises RuntimeError if
+    restic fails.
+    """
+    fields = compute(repo, source, target)
+    diff, _created = SnapshotDiff.objects.update_or_create(
+        repo=repo, source=source, target=target,
+        defaults=dict(fields, ended=timezone.now()),
+    )
+    return diff
@@ -0,0 +1,262 @@
+"""
+Local index of snapshot trees.
+
+Snapshots are immutable, so the complete tree of a snapshot is listed once
+with ``restic ls --recursive`` and stored in a small SQLite file per
+snapshot. Browsing a snapshot is then answered from that file instead of
+starting restic for every directory click. The first visit of a snapshot
+starts the listing in a background thread and is answered by a single
+directory `restic ls` meanwhile. A lock file per snapshot makes sure
+only one process of the host builds the index.
+
+Index files live in ``SNAPSHOT_INDEX_PATH/<repo id>/<snapshot id>.sqlite3``.
+The files are evicted least recently used first, as soon as all of them
+together take more than ``SNAPSHOT_INDEX_MAX_SIZE`` bytes on disk.
+"""
+import fcntl
+import glob
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+from django.conf import settings
+from django.db import connection
+
+from repository import lru
+from repository.parsing import loads, Snapshot, Node
+from repository.restic import ResticStream
+
+INDEX_SUFFIX = '.sqlite3'
+BATCH_SIZE = 5000
+
+# (repo id, snapshot id) of the indexes built in the background right now
+_building = set()
+_building_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE snapshot (data TEXT NOT NULL);
+CREATE TABLE node (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER,
+    mtime TEXT
+) WITHOUT ROWID;
+CREATE INDEX node_parent ON node (parent, name);
+"""
+
+
+def index_root():
+    return getattr(settings, 'SNAPSHOT_INDEX_PATH', None)
+
+
+def max_size():
+    return getattr(settings, 'SNAPSHOT_INDEX_MAX_SIZE', 1 << 30)
+
+
+def repo_dir(repo):
+    return os.path.join(index_root(), str(repo.pk))
+
+
+def normalize(path):
+    """Restic paths are absolute and never end with a slash (except root)."""
+    if not path:
+        return '/'
+    path = '/' + path.strip('/')
+    return path
+
+
+def parent_of(path):
+    return os.path.dirname(path) or '/'
+
+
+def find(repo, snapshot_id):
+    """
+    Returns the index file for `snapshot_id` (full or short id)
+    or None if the snapshot has not been indexed yet.
+    """
+    if index_root() is None or not snapshot_id:
+        return None
+    pattern = os.path.join(repo_dir(repo), glob.escape(snapshot_id) + '*' + INDEX_SUFFIX)
+    matches = glob.glob(pattern)
+    if len(matches) != 1:
+        return None
+    return matches[0]
+
+
+def build(repo, snapshot_id):
+    """
+    Lists the complete tree of `snapshot_id` and stores it in a new index.
+    Returns the path of the index or None if restic failed.
+    """
+    if index_root() is None:
+        return None
+    directory = repo_dir(repo)
+    os.makedirs(directory, exist_ok=True)
+
+    # Fill a temporary file, so concurrent readers never see a partial index
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    os.close(fd)
+    snapshot = None
+    command = ['restic', '-r', repo.path, 'ls', '--recursive', snapshot_id, '--json']
+    try:
+        con = sqlite3.connect(tmp_path)
+        try:
+            con.executescript(SCHEMA)
+            batch = []
+            with ResticStream(repo, command, governed=True) as stream:
+                for item in stream:
+                    if item.get('struct_type') == 'snapshot':
+                        snapshot = item
+                        con.execute('INSERT INTO snapshot (data) VALUES (?)', (json.dumps(item),))
+                    elif item.get('struct_type') == 'node':
+                        path = item['path']
+                        batch.append((
+                            path, parent_of(path), item['name'], item['type'],
+                            item.get('size'), item.get('mtime'),
+                        ))
+                        if len(batch) >= BATCH_SIZE:
+                            con.executemany('INSERT OR REPLACE INTO node VALUES (?, ?, ?, ?, ?, ?)', batch)
+                            batch = []
+            con.executemany('INSERT OR REPLACE INTO node VALUES (?, ?, ?, ?, ?, ?)', batch)
+            con.commit()
+        finally:
+            con.close()
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    if snapshot is None or stream.returncode != 0:
+        os.remove(tmp_path)
+        return None
+    index_path = os.path.join(directory, snapshot['id'] + INDEX_SUFFIX)
+    os.replace(tmp_path, index_path)
+    evict(keep=index_path)
+    return index_path
+
+
+def lock_build(repo, snapshot_id):
+    """
+    Returns the locked lock file for building the index of `snapshot_id`
+    or None if another process is building it.
+    """
+    directory = repo_dir(repo)
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, '.{}.lock'.format(snapshot_id)), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _build_in_thread(repo, snapshot_id, key):
+    try:
+        lock_file = lock_build(repo, snapshot_id)
+        if lock_file is not None:
+            try:
+                # another process may have built it in the meantime
+                if find(repo, snapshot_id) is not None or build(repo, snapshot_id) is not None:
+                    # a process which opened the file meanwhile finds the index
+                    os.remove(lock_file.name)
+            finally:
+                lock_file.close()
+    except Exception:
+        # the next visit of the snapshot tries again
+        pass
+    finally:
+        with _building_lock:
+            _building.discard(key)
+        # the thread owns its own connection, don't leave it open
+        connection.close()
+
+
+def build_async(repo, snapshot_id):
+    """
+    Builds the index of `snapshot_id` (a full id) in a background thread.
+    Returns False if it exists or is already being built by this process.
+    """
+    if index_root() is None or not snapshot_id or find(repo, snapshot_id) is not None:
+        return False
+    key = (repo.pk, snapshot_id)
+    with _building_lock:
+        if key in _building:
+            return False
+        _building.add(key)
+    thread = threading.Thread(target=_build_in_thread, args=(repo, snapshot_id, key), daemon=True)
+    thread.start()
+    return True
+
+
+def get_or_build(repo, snapshot_id):
+    index_path = find(repo, snapshot_id)
+    if index_path is None:
+        index_path = build(repo, snapshot_id)
+    if index_path is not None:
+        touch(index_path)
+    return index_path
+
+
+def browse(index_path, path):
+    """
+    Returns the snapshot, the node of `path` (None for the root directory)
+    and the list of nodes directly beneath `path`.
+    """
+    path = normalize(path)
+    con = sqlite3.connect('file:{}?mode=ro'.format(index_path), uri=True)
+    con.row_factory = sqlite3.Row
+    try:
+        row = con.execute('SELECT data FROM snapshot').fetchone()
+        snapshot = Snapshot.from_dict(loads(row['data']))
+        row = con.execute('SELECT * FROM node WHERE path = ?', (path,)).fetchone()
+        current = node_from_row(row) if row is not None else None
+        rows = con.execute(
+            'SELECT * FROM node WHERE parent = ? AND path != ? ORDER BY name', (path, path)
+        ).fetchall()
+        children = [node_from_row(row) for row in rows]
+    finally:
+        con.close()
+    return snapshot, current, children
+
+
+def node_from_row(row):
+    return Node(**dict(row))
+
+
+def touch(index_path):
+    """Marks the index as recently used for the LRU eviction."""
+    lru.touch(index_path)
+
+
+def index_files(repo=None):
+    if index_root() is None:
+        return []
+    if repo is None:
+        pattern = os.path.join(index_root(), '*', '*' + INDEX_SUFFIX)
+    else:
+        pattern = os.path.join(repo_dir(repo), '*' + INDEX_SUFFIX)
+    return glob.glob(pattern)
+
+
+def evict(keep=None):
+    """
+    Removes least recently used indexes until all indexes fit into
+    SNAPSHOT_INDEX_MAX_SIZE. Returns the number of removed indexes.
+    """
+    return lru.evict(index_files(), max_size(), keep)
+
+
+def drop(repo=None, snapshot_id=None):
+    """Removes the indexes of one snapshot, one repository or all repositories."""
+    if snapshot_id is not None:
+        index_path = find(repo, snapshot_id)
+        files = [index_path] if index_path else []
+    else:
+        files = index_files(repo)
+    for index_path in files:
+        os.remove(index_path)
+    return len(files)
@@ -3,7 +3,7 @@ import os
 from django import template
 from django.utils.safestring import mark_safe
 
-from repository.models import FileExt
+from repository.file_icons import icon_map
 
 register = template.Library()
 
@@ -18,10 +18,9 @@ def get_file_icon(name):
 
     if file_extension is None or file_extension == '':
         return (mark_safe(generic))
-    else:
-        try:
-            ext = FileExt.objects.get(name=file_extension.lower())
-        except FileExt.DoesNotExist:
-            return (mark_safe(generic))
 
-    return mark_safe(ext.type.svg_path)
+    # one dictionary lookup per file instead of two queries
+    svg_path = icon_map().get(file_extension.lower())
+    if svg_path is None:
+        return (mark_safe(generic))
+    return mark_safe(svg_path)
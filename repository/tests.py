@@ -1,2 +1,523 @@
+import datetime
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from repository import governor, jobs, lru, retention, snapshot_index
+from repository.download_cache import parse_range, RangeFile
+from repository.models import Job, Journal, Repository, RepoSize, RepoSizeHourly
+from repository.restic import list_directory, restic_command
+from repository.views import journal_cursor, parse_journal_cursor
+
+FAKE_RESTIC = os.path.join(settings.BASE_DIR, 'benchmarks', 'fake_restic.py')
+
+# a directory listing which goes on past the listed directory, then stalls
+LISTING_SCRIPT = """#!{python}
+import json, sys, time
+def node(path, type):
+    return {{'struct_type': 'node', 'name': path.rsplit('/', 1)[-1], 'path': path, 'type': type}}
+lines = [
+    {{'struct_type': 'snapshot', 'id': 'a' * 64, 'short_id': 'a' * 8, 'time': '2024-01-01T00:00:00Z', 'paths': ['/data']}},
+    node('/data/a', 'dir'),
+    node('/data/a/one.txt', 'file'),
+    node('/data/a/sub', 'dir'),
+    node('/data/a/sub/deep.txt', 'file'),
+    node('/data/b', 'dir'),
+]
+for line in lines:
+    print(json.dumps(line), flush=True)
+time.sleep(30)
+"""
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=datetime.timezone.utc)
+
+
+class FakeResticMixin:
+    """Runs the repositories of a test with benchmarks/fake_restic.py as restic."""
+
+    fake_restic_env = {'FAKE_RESTIC_SNAPSHOTS': '2', 'FAKE_RESTIC_DIRS': '3', 'FAKE_RESTIC_FILES': '4'}
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.bin = os.path.join(self.tmp, 'bin')
+        os.mkdir(self.bin)
+        os.symlink(FAKE_RESTIC, os.path.join(self.bin, 'restic'))
+        settings_override = override_settings(RESTIC_LOCK_PATH=os.path.join(self.tmp, 'locks'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_repo(self, **env):
+        extra_keys = dict(self.fake_restic_env, PATH=self.bin + os.pathsep + os.environ.get('PATH', ''), **env)
+        return Repository.objects.create(name='test', password='secret', path='/tmp/repo', extra_keys=extra_keys)
+
+    def replace_restic(self, script):
+        path = os.path.join(self.bin, 'restic')
+        os.remove(path)
+        with open(path, 'w') as f:
+            f.write(script.format(python=sys.executable))
+        os.chmod(path, 0o755)
+
+
+class ParseRangeTest(SimpleTestCase):
+
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(parse_range('bytes=500-', 1000), (500, 999))
+        self.assertEqual(parse_range('bytes=900-5000', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(parse_range('bytes=-5000', 1000), (0, 999))
+
+    def test_whole_file(self):
+        for header in (None, '', 'items=0-1', 'bytes=0-1,5-6', 'bytes=a-b', 'bytes=5'):
+            self.assertIsNone(parse_range(header, 1000), header)
+
+    def test_not_satisfiable(self):
+        for header in ('bytes=1000-', 'bytes=5-3', 'bytes=-0'):
+            with self.assertRaises(ValueError):
+                parse_range(header, 1000)
+        with self.assertRaises(ValueError):
+            parse_range('bytes=0-', 0)
+
+
+class RangeFileTest(SimpleTestCase):
+
+    def test_reads_at_most_length(self):
+        file = io.BytesIO(b'0123456789')
+        file.seek(2)
+        range_file = RangeFile(file, 5)
+        self.assertEqual(range_file.read(3), b'234')
+        self.assertEqual(range_file.tell(), 5)
+        self.assertEqual(range_file.read(), b'56')
+        self.assertEqual(range_file.read(10), b'')
+        range_file.close()
+        self.assertTrue(file.closed)
+
+    def test_fileno(self):
+        with tempfile.TemporaryFile() as file:
+            self.assertEqual(RangeFile(file, 1).fileno(), file.fileno())
+
+
+class JournalCursorTest(TestCase):
+
+    def test_round_trip(self):
+        user = User.objects.create_user('cursor')
+        repo = Repository.objects.create(name='test', password='secret', path='/tmp/repo')
+        entry = Journal.objects.create(user=user, repo=repo, action='1', data='/data')
+        entry.refresh_from_db()
+        self.assertEqual(parse_journal_cursor(journal_cursor(entry)), (entry.timestamp, entry.pk))
+
+    def test_invalid(self):
+        for value in (None, '', 'abc', '1-2-3', '1-x', '99999999999999999999999-1'):
+            self.assertIsNone(parse_journal_cursor(value), value)
+
+
+class RetentionTest(TestCase):
+
+    def setUp(self):
+        self.repo = Repository.objects.create(name='test', password='secret', path='/tmp/repo')
+
+    def sample(self, timestamp, size):
+        sample = RepoSize.objects.create(repo=self.repo, size=size, file_count=size // 10, raw_size=size // 2)
+        # timestamp is set on creation
+        RepoSize.objects.filter(pk=sample.pk).update(timestamp=timestamp)
+
+    def test_merge(self):
+        self.assertEqual(retention.merge(None, 0, 10, 1), 10)
+        self.assertEqual(retention.merge(10, 1, None, 1), 10)
+        self.assertEqual(retention.merge(100, 1, 250, 2), 200)
+
+    def test_rollup(self):
+        for minute, size in ((0, 100), (20, 200), (40, 300)):
+            self.sample(utc(2024, 1, 1, 10, minute), size)
+        self.sample(utc(2024, 1, 1, 11, 30), 1000)
+        self.sample(utc(2024, 1, 1, 12, 30), 5)
+
+        removed = retention.rollup(RepoSize, RepoSizeHourly, 'hour', utc(2024, 1, 1, 12))
+
+        self.assertEqual(removed, 4)
+        self.assertEqual(list(RepoSize.objects.values_list('size', flat=True)), [5])
+        rollups = list(RepoSizeHourly.objects.values_list('timestamp', 'size', 'file_count', 'raw_size', 'samples'))
+        self.assertEqual(rollups, [
+            (utc(2024, 1, 1, 10), 200, 20, 100, 3),
+            (utc(2024, 1, 1, 11), 1000, 100, 500, 1),
+        ])
+
+    def test_rollup_merges_existing(self):
+        RepoSizeHourly.objects.create(
+            repo=self.repo, timestamp=utc(2024, 1, 1, 10), size=100, file_count=10, raw_size=None, samples=1
+        )
+        self.sample(utc(2024, 1, 1, 10, 10), 200)
+        self.sample(utc(2024, 1, 1, 10, 50), 300)
+
+        retention.rollup(RepoSize, RepoSizeHourly, 'hour', utc(2024, 1, 1, 12))
+
+        rollup = RepoSizeHourly.objects.get()
+        self.assertEqual((rollup.size, rollup.file_count, rollup.raw_size, rollup.samples), (200, 20, 125, 3))
+        self.assertFalse(RepoSize.objects.exists())
+
+
+class EvictTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def make_file(self, name, size, mtime):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_least_recently_used_first(self):
+        old = self.make_file('old', 100, 1000)
+        middle = self.make_file('middle', 100, 2000)
+        new = self.make_file('new', 100, 3000)
+        missing = os.path.join(self.tmp, 'missing')
+
+        self.assertEqual(lru.evict([new, missing, old, middle], 250), 1)
+        self.assertEqual(sorted(os.listdir(self.tmp)), ['middle', 'new'])
+        self.assertEqual(lru.evict([new, middle], 250), 0)
+
+    def test_keep(self):
+        old = self.make_file('old', 100, 1000)
+        new = self.make_file('new', 100, 2000)
+
+        self.assertEqual(lru.evict([old, new], 100, keep=old), 1)
+        self.assertEqual(os.listdir(self.tmp), ['old'])
+
+    def test_touch(self):
+        old = self.make_file('old', 100, 1000)
+        new = self.make_file('new', 100, 2000)
+        lru.touch(old)
+        lru.touch(os.path.join(self.tmp, 'missing'))
+
+        lru.evict([old, new], 100)
+        self.assertEqual(os.listdir(self.tmp), ['old'])
+
+
+class GovernorTest(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.repo, self.other, self.third = Repository(pk=1), Repository(pk=2), Repository(pk=3)
+        self.command = ['restic', '-r', '/tmp/repo', 'snapshots']
+
+    def test_repo_limit(self):
+        with override_settings(RESTIC_LOCK_PATH=self.tmp, RESTIC_REPO_LIMIT=1, RESTIC_GLOBAL_LIMIT=4):
+            with governor.slot(self.repo, self.command):
+                with self.assertRaises(subprocess.TimeoutExpired):
+                    with governor.slot(self.repo, self.command, timeout=0.3):
+                        pass
+                with governor.slot(self.other, self.command, timeout=0.3):
+                    pass
+            # freed again
+            with governor.slot(self.repo, self.command, timeout=0.3):
+                pass
+
+    def test_global_limit(self):
+        with override_settings(RESTIC_LOCK_PATH=self.tmp, RESTIC_REPO_LIMIT=2, RESTIC_GLOBAL_LIMIT=2):
+            with governor.slot(self.repo, self.command), governor.slot(self.other, self.command):
+                with self.assertRaises(subprocess.TimeoutExpired):
+                    with governor.slot(self.third, self.command, timeout=0.3):
+                        pass
+
+    def test_exclusive(self):
+        prune = ['restic', '-r', '/tmp/repo', 'prune']
+        with override_settings(RESTIC_LOCK_PATH=self.tmp, RESTIC_REPO_LIMIT=2, RESTIC_GLOBAL_LIMIT=4):
+            with governor.slot(self.repo, self.command):
+                with self.assertRaises(subprocess.TimeoutExpired):
+                    with governor.slot(self.repo, prune, timeout=0.3):
+                        pass
+            with governor.slot(self.repo, prune):
+                with self.assertRaises(subprocess.TimeoutExpired):
+                    with governor.slot(self.repo, self.command, timeout=0.3):
+                        pass
+
+    def test_timeout_counts_from_the_start(self):
+        with override_settings(RESTIC_LOCK_PATH=self.tmp, RESTIC_REPO_LIMIT=1, RESTIC_GLOBAL_LIMIT=1):
+            with governor.slot(self.other, self.command):
+                start = time.monotonic()
+                with self.assertRaises(subprocess.TimeoutExpired):
+                    with governor.slot(self.repo, self.command, timeout=0.5):
+                        pass
+                self.assertLess(time.monotonic() - start, 2)
+
+    def test_command_name(self):
+        self.assertEqual(governor.command_name(['restic', '-r', 'prune', 'snapshots', '--json']), 'snapshots')
+        self.assertEqual(governor.command_name(['restic', '--repo', '/tmp/repo', 'prune']), 'prune')
+        self.assertIsNone(governor.command_name(['restic', '-r', '/tmp/repo']))
+
+
+class ResticCommandTest(FakeResticMixin, TestCase):
+
+    def test_ungoverned_commands_do_not_wait(self):
+        repo = self.make_repo()
+        command = ['restic', '-r', repo.path, 'snapshots', '--json']
+        with override_settings(RESTIC_REPO_LIMIT=1):
+            with governor.slot(repo, command):
+                with self.assertRaises(subprocess.TimeoutExpired):
+                    restic_command(repo, command, timeout=0.3)
+                result = restic_command(repo, command, timeout=10, governed=False)
+        self.assertEqual(result.returncode, 0)
+
+
+class ListDirectoryTest(FakeResticMixin, TestCase):
+
+    def test_children(self):
+        repo = self.make_repo()
+        snapshot, current, children = list_directory(repo, 'latest', '/data')
+        self.assertEqual(snapshot.paths, ['/data'])
+        self.assertEqual(current.path, '/data')
+        self.assertEqual([node.name for node in children], ['dir_00000', 'dir_00001', 'dir_00002'])
+
+    def test_stops_after_the_directory(self):
+        self.replace_restic(LISTING_SCRIPT)
+        repo = self.make_repo()
+        start = time.monotonic()
+        snapshot, current, children = list_directory(repo, 'a' * 8, '/data/a/')
+        # restic is killed instead of waiting for the end of its output
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual(current.path, '/data/a')
+        self.assertEqual([node.path for node in children], ['/data/a/one.txt', '/data/a/sub'])
+
+
+class SnapshotIndexTest(FakeResticMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(SNAPSHOT_INDEX_PATH=os.path.join(self.tmp, 'index'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.repo = self.make_repo()
+        self.snapshot_id = restic_command(self.repo, ['restic', '-r', self.repo.path, 'list', 'snapshots']).stdout.split()[0].decode()
+
+    def test_build_and_browse(self):
+        index_path = snapshot_index.build(self.repo, self.snapshot_id[:8])
+        self.assertEqual(os.path.basename(index_path), self.snapshot_id + snapshot_index.INDEX_SUFFIX)
+        self.assertEqual(snapshot_index.find(self.repo, self.snapshot_id[:8]), index_path)
+        self.assertEqual(os.listdir(os.path.dirname(index_path)), [os.path.basename(index_path)])
+
+        snapshot, current, children = snapshot_index.browse(index_path, '/')
+        self.assertEqual(snapshot.id, self.snapshot_id)
+        self.assertIsNone(current)
+        self.assertEqual([node.path for node in children], ['/data'])
+
+        snapshot, current, children = snapshot_index.browse(index_path, '/data/dir_00001/')
+        self.assertEqual(current.type, 'dir')
+        self.assertEqual([node.name for node in children], ['file_{:05d}.txt'.format(i) for i in range(4)])
+        self.assertEqual({node.size for node in children}, {65536})
+
+    def test_browse_matches_list_directory(self):
+        index_path = snapshot_index.build(self.repo, self.snapshot_id)
+        _snapshot, current, children = snapshot_index.browse(index_path, '/data')
+        _snapshot, listed_current, listed_children = list_directory(self.repo, self.snapshot_id, '/data')
+        self.assertEqual(current.path, listed_current.path)
+        self.assertEqual([node.path for node in children], [node.path for node in listed_children])
+
+    def test_failed_build(self):
+        self.assertIsNone(snapshot_index.build(self.repo, 'ffffffff'))
+        self.assertEqual(os.listdir(snapshot_index.repo_dir(self.repo)), [])
+        self.assertIsNone(snapshot_index.find(self.repo, 'ffffffff'))
+
+    def test_eviction(self):
+        with override_settings(SNAPSHOT_INDEX_MAX_SIZE=1):
+            first = snapshot_index.build(self.repo, self.snapshot_id)
+            # the newest index is kept even if it alone is too large
+            self.assertTrue(os.path.exists(first))
+            second_id = restic_command(self.repo, ['restic', '-r', self.repo.path, 'list', 'snapshots']).stdout.split()[1].decode()
+            second = snapshot_index.build(self.repo, second_id)
+        self.assertFalse(os.path.exists(first))
+        self.assertEqual(snapshot_index.index_files(self.repo), [second])
+
+
+@override_settings(RESTIC_CACHE_PATH=None, SEARCH_INDEX_PATH=None)
+class ConditionalTest(FakeResticMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(SNAPSHOT_INDEX_PATH=os.path.join(self.tmp, 'index'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.repo = self.make_repo()
+        # a local repository, its snapshots directory dates the snapshot list
+        self.repo.path = os.path.join(self.tmp, 'repo')
+        os.makedirs(os.path.join(self.repo.path, 'snapshots'))
+        self.repo.save()
+        self.client.force_login(User.objects.create_user('conditional'))
+
+    def assertNotModified(self, url):
+        # the first page sets the CSRF cookie, which is part of the ETag
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_snapshots(self):
+        url = reverse('repository:snapshots', args=[self.repo.pk])
+        etag = self.assertNotModified(url)
+        # a new snapshot changes the ETag
+        os.utime(os.path.join(self.repo.path, 'snapshots'), ns=(0, 0))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_browse(self):
+        snapshot_id = restic_command(self.repo, ['restic', '-r', self.repo.path, 'list', 'snapshots']).stdout.split()[0].decode()
+        snapshot_index.build(self.repo, snapshot_id)
+        url = reverse('repository:browse', args=[self.repo.pk, 'icon']) + '?id={}&path=/data'.format(snapshot_id)
+        self.assertNotModified(url)
+        self.assertIn('immutable', self.client.get(url)['Cache-Control'])
+
+    def test_chart(self):
+        url = reverse('repository:get_charts') + '?repo={}'.format(self.repo.pk)
+        RepoSize.objects.create(repo=self.repo, size=100, file_count=10)
+        etag = self.assertNotModified(url)
+        # a new sample changes the ETag
+        RepoSize.objects.create(repo=self.repo, size=200, file_count=20)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_invalid_chart_repo(self):
+        response = self.client.get(reverse('repository:get_charts') + '?repo=abc')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(RESTIC_CACHE_PATH=None, SEARCH_INDEX_PATH=None, JOB_HEARTBEAT_TIMEOUT=60)
+class JobsTest(FakeResticMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('jobs')
+        self.repo = self.make_repo()
+
+    def running_job(self, worker, heartbeat_age=0):
+        job = jobs.enqueue(self.user, self.repo, '1', '/data', path='/data')
+        Job.objects.filter(pk=job.pk).update(
+            status='running', worker=worker, heartbeat=timezone.now() - datetime.timedelta(seconds=heartbeat_age)
+        )
+        return Job.objects.get(pk=job.pk)
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        return process.pid
+
+    def test_claim(self):
+        job = jobs.enqueue(self.user, self.repo, '1', '/data', path='/data')
+        self.assertEqual(jobs.claim_next(10), [job])
+        self.assertEqual(jobs.claim_next(10), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), ('running', jobs.worker_name()))
+
+    def test_heartbeat(self):
+        job = self.running_job(jobs.worker_name(), heartbeat_age=3600)
+        jobs.heartbeat([job.pk])
+        job.refresh_from_db()
+        self.assertLess(timezone.now() - job.heartbeat, datetime.timedelta(seconds=60))
+
+    def test_reset_interrupted(self):
+        host = socket.gethostname()
+        stale = self.running_job('other-host:1', heartbeat_age=3600)
+        other_host = self.running_job('other-host:1')
+        dead = self.running_job('{}:{}'.format(host, self.dead_pid()))
+        alive = self.running_job('{}:{}'.format(host, os.getppid()))
+        own = self.running_job(jobs.worker_name())
+
+        self.assertEqual(jobs.reset_interrupted(own_job_ids=[own.pk]), 2)
+
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses[stale.pk], 'failed')
+        self.assertEqual(statuses[dead.pk], 'failed')
+        self.assertEqual(statuses[other_host.pk], 'running')
+        self.assertEqual(statuses[alive.pk], 'running')
+        self.assertEqual(statuses[own.pk], 'running')
+        self.assertEqual(Job.objects.get(pk=stale.pk).output, 'Interrupted')
+
+    def test_own_pid_of_a_former_worker(self):
+        job = self.running_job(jobs.worker_name())
+        self.assertEqual(jobs.reset_interrupted(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_fail(self):
+        job = self.running_job(jobs.worker_name())
+        self.assertEqual(jobs.fail(job, 'error'), 1)
+        # an ended job keeps its outcome
+        self.assertEqual(jobs.fail(job, 'again'), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.output), ('failed', 'error'))
+
+    def test_run_backup(self):
+        job = jobs.enqueue(self.user, self.repo, '1', '/data', path='/data')
+        jobs.claim(job)
+        jobs.run(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.progress['percent'], 100)
+        self.assertTrue(Journal.objects.filter(repo=self.repo, action='1', success=True).exists())
+        self.assertTrue(RepoSize.objects.filter(repo=self.repo).exists())
+
+    def test_enqueue_once(self):
+        first = jobs.enqueue_once('diff:1', self.user, self.repo, '6', 'diff', source='a', target='b')
+        self.assertEqual(jobs.enqueue_once('diff:1', self.user, self.repo, '6', 'diff', source='a', target='b'), first)
+        Job.objects.filter(pk=first.pk).update(status='done')
+        # a finished job does not keep the key
+        self.assertNotEqual(jobs.enqueue_once('diff:1', self.user, self.repo, '6', 'diff', source='a', target='b'), first)
+
+
+class JournalViewTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('journal')
+        repo = Repository.objects.create(name='test', password='secret', path='/tmp/repo')
+        for i in range(120):
+            Journal.objects.create(user=user, repo=repo, action='1', data=str(i))
+        # pairs of entries share a timestamp, the id breaks the tie
+        for entry in Journal.objects.all():
+            Journal.objects.filter(pk=entry.pk).update(timestamp=utc(2024, 1, 1) + datetime.timedelta(minutes=int(entry.data) // 2))
+        self.client.force_login(user)
+        self.url = reverse('repository:journal')
+
+    def page(self, query=''):
+        response = self.client.get(self.url + query)
+        return [entry.data for entry in response.context['journal_list']], response.context
+
+    def test_paging(self):
+        newest, ctx = self.page()
+        self.assertEqual(newest, [str(i) for i in range(119, 69, -1)])
+        self.assertNotIn('newer_url', ctx)
+
+        middle, ctx = self.page(ctx['older_url'])
+        self.assertEqual(middle, [str(i) for i in range(69, 19, -1)])
+
+        oldest, oldest_ctx = self.page(ctx['older_url'])
+        self.assertEqual(oldest, [str(i) for i in range(19, -1, -1)])
+        self.assertNotIn('older_url', oldest_ctx)
+
+        # back again
+        self.assertEqual(self.page(oldest_ctx['newer_url'])[0], middle)
+        back, ctx = self.page(ctx['newer_url'])
+        self.assertEqual(back, newest)
+        self.assertNotIn('newer_url', ctx)
+        self.assertIn('older_url', ctx)
+
+    def test_filter_is_kept(self):
+        _entries, ctx = self.page('?action=1')
+        self.assertIn('action=1', ctx['older_url'])
@@ -9,12 +9,20 @@ urlpatterns = [
     path('create/', views.RepositoryCreate.as_view(), name='create'),
     path('update/<int:pk>/', views.RepositoryUpdate.as_view(), name='update'),
     path('snapshots/<int:pk>/', views.RepositorySnapshots.as_view(), name='snapshots'),
+    path('snapshots/<int:pk>/search/', views.SnapshotSearch.as_view(), name='search'),
+    path('snapshots/<int:pk>/diff/', views.SnapshotDiffView.as_view(), name='diff'),
     path('browse/<int:pk>/<str:view>/', views.FileBrowse.as_view(), name='browse'),
     path('restore/<int:pk>/<str:view>/', views.RestoreView.as_view(), name='restore'),
     path('download/<int:pk>/<str:view>/', views.Download.as_view(), name='download'),
+    path('download/<int:pk>/<str:view>/file/', views.FileDownload.as_view(), name='download_file'),
     path('backup/<int:pk>/', views.BackupView.as_view(), name='backup'),
     path('newbackup/<int:pk>/', views.NewBackupView.as_view(), name='newbackup'),
     path('journal/', views.JournalView.as_view(), name='journal'),
+    path('jobs/', views.JobList.as_view(), name='jobs'),
+    path('jobs/<int:pk>/', views.JobDetail.as_view(), name='job'),
+    path('jobs/<int:pk>/events/', views.job_events, name='job_events'),
+    path('disk_usage/refresh/', views.DiskUsageRefresh.as_view(), name='disk_usage_refresh'),
     path('chart/<int:pk>/', views.RepositoryChart.as_view(), name='chart'),
     path('get_chart/<int:repo_id>/', views.repository_chart, name='get_chart'),
+    path('get_charts/', views.repository_charts, name='get_charts'),
 ]
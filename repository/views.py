@@ -1,101 +1,60 @@
+import asyncio
+import datetime
+import itertools
 import json
+import mimetypes
 import os
 import shutil
 import subprocess
-from types import SimpleNamespace
 
 import humanize
+from asgiref.sync import sync_to_async
 from bootstrap_modal_forms.generic import BSModalFormView
-from dateutil.parser import parse
+from bootstrap_modal_forms.mixins import is_ajax
 from django.conf import settings
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.http import FileResponse, JsonResponse
-from django.shortcuts import redirect
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import OuterRef, Q, Subquery
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest, JsonResponse, Http404, HttpResponseForbidden, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.decorators import method_decorator
+from django.utils.http import content_disposition_header
 from django.utils.text import slugify
-from django.views.generic import ListView, DetailView, UpdateView, CreateView
+from django.views.decorators.http import condition
+from django.views.generic import View, ListView, DetailView, UpdateView, CreateView
 from django.utils.translation import gettext_lazy as _
 
-from repository.callstack import push, delete_to, clear, peek
-from repository.forms import RestoreForm, RepositoryForm, NewBackupForm
-from repository.models import Repository, CallStack, Journal, RepoSize
-from .chart_utils import repo_datasets
-
-
-def restic_command(repo, command):
-    my_env = os.environ.copy()
-    my_env["RESTIC_PASSWORD"] = repo.password
-    for key, value in repo.extra_keys.items():
-        my_env[key] = value
-
-    if settings.DEBUG:
-        print('Issue restic_command: "%s"' % command)
-    # return subprocess.run(command, stdout=subprocess.PIPE, env=my_env, capture_output=True)
-
-    # Capture stderr so we can later display usefull messages in case of error
-    # capture_output=True requires Python 3.7 or higher
-    return subprocess.run(command, env=my_env, capture_output=True)
-
-
-def get_directory_size(directory):
-    """Returns the `directory` size in bytes."""
-    total = 0
-    try:
-        for entry in os.scandir(directory):
-            if entry.is_file():
-                # if it's a file, use stat() function
-                total += entry.stat().st_size
-            elif entry.is_dir():
-                # if it's a directory, recursively call this function
-                total += get_directory_size(entry.path)
-    except NotADirectoryError:
-        # if `directory` isn't a directory, get the file size then
-        return os.path.getsize(directory)
-    except (PermissionError, FileNotFoundError):
-        # if for whatever reason we can't open the folder, return 0
-        return 0
-    return total
-
-
-def LogRepoSize(repo):
-    command = ['restic', '-r', repo.path, 'stats', '--json']
-    result = restic_command(repo, command)
-    data = json.loads(result.stdout)
-    # RepoSize.objects.create(repo=repo, size=get_directory_size(repo.path))
-    RepoSize.objects.create(
-        repo=repo,
-        size=data['total_size'],
-        file_count=data['total_file_count'],
-    )
+from repository import conditional, disk_usage, download_cache, jobs, metrics, restic_cache, search_index, snapshot_diff, snapshot_index
+from repository.forms import JournalFilterForm, RestoreForm, RepositoryForm, NewBackupForm
+from repository.models import Repository, Journal, DiskUsage, Job
+from repository.parsing import parse_snapshots
+from repository.restic import restic_command, list_directory, ResticStream
+from .chart_utils import repo_datasets, repos_datasets, DEFAULT_POINTS
 
 
 class RepositoryList(LoginRequiredMixin, ListView):
     model = Repository
 
-    def get(self, request, *args, **kwargs):
-        clear()
-        return super(RepositoryList, self).get(request, *args, **kwargs)
-
     def get_queryset(self):
-        qs = Repository.objects.all()
+        # Walking the repositories is far too slow for a page load,
+        # show the latest sample of the disk usage sampler instead.
+        latest = DiskUsage.objects.filter(repo=OuterRef('pk')).order_by('-timestamp')
+        qs = Repository.objects.annotate(
+            disk_size=Subquery(latest.values('size')[:1]),
+            disk_size_timestamp=Subquery(latest.values('timestamp')[:1]),
+        )
         for repo in qs:
-            repo.size = humanize.naturalsize(get_directory_size(repo.path), binary=False)
+            if repo.disk_size is not None:
+                repo.size = humanize.naturalsize(repo.disk_size, binary=False)
         return qs
 
-    def collect_chart_datasets(self):
-        chart_datasets = []
-        repos = Repository.objects.all()
-        for index, repo in enumerate(repos):
-            datasets, time_unit = repo_datasets(index, repo)
-            chart_datasets.append({
-                'repo': repo,
-                'datasets': json.dumps(datasets),
-                'time_unit': time_unit,
-            })
-        return chart_datasets
-
     def get_context_data(self, *, object_list=None, **kwargs):
         ctx = super(RepositoryList, self).get_context_data(**kwargs)
         try:
@@ -115,10 +74,19 @@ class RepositoryList(LoginRequiredMixin, ListView):
             ctx['bar_class'] = 'bg-warning'
         else:
             ctx['bar_class'] = 'bg-danger'
-        ctx['chart_datasets'] = self.collect_chart_datasets()
         return ctx
 
 
+class DiskUsageRefresh(LoginRequiredMixin, View):
+
+    def post(self, request, *args, **kwargs):
+        if disk_usage.refresh_async():
+            messages.info(request, _('The disk usage is being refreshed in the background.'))
+        else:
+            messages.info(request, _('The disk usage is already being refreshed.'))
+        return redirect('repository:list')
+
+
 class RepositoryChart(LoginRequiredMixin, DetailView):
     model = Repository
     template_name = 'repository/repository_chart.html'
@@ -135,13 +103,79 @@ class RepositoryChart(LoginRequiredMixin, DetailView):
 #     return JsonResponse(data={'labels': labels, 'data': data, 'unit': unit})
 
 
+def parse_chart_time(value):
+    """Accepts dates and datetimes, naive values are in the current time zone."""
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed = parse_date(value)
+            if parsed is None:
+                return None
+            parsed = datetime.datetime.combine(parsed, datetime.time())
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+@condition(etag_func=conditional.chart_etag, last_modified_func=conditional.chart_last_modified)
 def repository_chart(request, repo_id=None):
-    repo = Repository.objects.get(id=repo_id)
+    """
+    Chart data of a repository. Optional GET parameters: `start` and `end`
+    (dates or datetimes) and `points`, the maximum number of points per series.
+    """
+    repo = get_object_or_404(Repository, id=repo_id)
+    default_points = getattr(settings, 'CHART_POINTS', DEFAULT_POINTS)
+    try:
+        points = int(request.GET.get('points', default_points))
+    except ValueError:
+        points = default_points
+    points = min(max(points, 10), 5000)
     index = 0
-    datasets, time_unit = repo_datasets(index, repo)
+    datasets, time_unit = repo_datasets(
+        index, repo,
+        start=parse_chart_time(request.GET.get('start')),
+        end=parse_chart_time(request.GET.get('end')),
+        points=points,
+    )
     return JsonResponse({'datasets': datasets, 'time_unit': time_unit})
 
 
+@login_required
+@condition(etag_func=conditional.chart_etag, last_modified_func=conditional.chart_last_modified)
+def repository_charts(request):
+    """
+    Chart data of many repositories in one request, `repo` is repeated
+    for every repository. Accepts the parameters of repository_chart.
+    """
+    default_points = getattr(settings, 'CHART_POINTS', DEFAULT_POINTS)
+    try:
+        repo_ids = [int(repo_id) for repo_id in request.GET.getlist('repo')]
+        points = int(request.GET.get('points', default_points))
+    except ValueError:
+        return HttpResponseBadRequest()
+    points = min(max(points, 10), 5000)
+    charts = repos_datasets(
+        repo_ids,
+        start=parse_chart_time(request.GET.get('start')),
+        end=parse_chart_time(request.GET.get('end')),
+        points=points,
+    )
+    return JsonResponse({'charts': {
+        repo_id: {'datasets': datasets, 'time_unit': time_unit}
+        for repo_id, (datasets, time_unit) in charts.items()
+    }})
+
+
+def restic_metrics(request):
+    if not metrics.is_authorized(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class RepositoryUpdate(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
     model = Repository
     form_class = RepositoryForm
@@ -179,70 +213,132 @@ class RepositoryCreate(LoginRequiredMixin, SuccessMessageMixin, CreateView):
         return super(RepositoryCreate, self).form_valid(form)
 
 
+@method_decorator(
+    condition(etag_func=conditional.snapshots_etag, last_modified_func=conditional.snapshots_last_modified),
+    name='dispatch'
+)
 class RepositorySnapshots(LoginRequiredMixin, DetailView):
     model = Repository
     template_name = 'repository/repository_snapshots.html'
 
+    def get(self, request, *args, **kwargs):
+        response = super(RepositorySnapshots, self).get(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
     def get_context_data(self, **kwargs):
-        clear()
         ctx = super(RepositorySnapshots, self).get_context_data(**kwargs)
         repo = self.get_object()
 
         command = ['restic', '-r', repo.path, 'snapshots', '--json']
-        result = restic_command(repo, command)
+        result = restic_command(repo, command, governed=False)
         ctx['snapshots'] = None
         try:
-            snapshots = json.loads(result.stdout, object_hook=lambda d: SimpleNamespace(**d))
-            if snapshots is not None:
-                for snap in snapshots:
-                    snap.timestamp = parse(snap.time)
-                ctx['snapshots'] = reversed(snapshots)
+            snapshots = parse_snapshots(result.stdout)
+            ctx['snapshots'] = reversed(snapshots)
+            ctx['cache_size'] = restic_cache.size_label(repo)
         except json.JSONDecodeError:
             # Hopefully, something usefull can be retrieved from stdout
             messages.error(self.request, result.stderr.decode())
         return ctx
 
 
+class SnapshotSearch(LoginRequiredMixin, DetailView):
+    """Searches the paths of all snapshots in the search index."""
+    model = Repository
+    template_name = 'repository/repository_search.html'
+
+    def get_context_data(self, **kwargs):
+        ctx = super(SnapshotSearch, self).get_context_data(**kwargs)
+        query = self.request.GET.get('q', '')
+        ctx['query'] = query
+        ctx['index_exists'] = search_index.exists(self.object)
+        ctx['results'] = search_index.search(self.object, query) if query else []
+        ctx['limit'] = search_index.RESULT_LIMIT
+        return ctx
+
+
+class SnapshotDiffView(LoginRequiredMixin, DetailView):
+    """
+    Changes between the snapshots `source` and `target` (full ids). Until
+    the diff is stored it is computed by a job, a request for a pair which
+    is already being computed is sent to the same job.
+    """
+    model = Repository
+    template_name = 'repository/snapshot_diff.html'
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        source = request.GET.get('source', '')
+        target = request.GET.get('target', '')
+        if not (conditional.is_full_id(source) and conditional.is_full_id(target)):
+            raise Http404
+        diff = snapshot_diff.find(self.object, source, target)
+        if diff is not None:
+            return self.render_to_response(self.get_context_data(source=source, target=target, diff=diff))
+
+        job = jobs.enqueue_once(
+            'diff:{}:{}:{}'.format(self.object.pk, source, target),
+            request.user, self.object, '6', '{}..{}'.format(source[:8], target[:8]),
+            source=source, target=target, return_url=request.get_full_path(),
+        )
+        return redirect('repository:job', pk=job.pk)
+
+
+BROWSE_VIEWS = ('icon', 'list')
+
+
+def path_breadcrumbs(path):
+    """[{'name': 'home', 'path': '/home'}, {'name': 'user', 'path': '/home/user'}] for /home/user"""
+    crumbs = []
+    current = ''
+    for name in path.strip('/').split('/'):
+        if name:
+            current += '/' + name
+            crumbs.append({'name': name, 'path': current})
+    return crumbs
+
+
+@method_decorator(condition(etag_func=conditional.browse_etag), name='dispatch')
 class FileBrowse(LoginRequiredMixin, DetailView):
     model = Repository
 
     def get(self, request, *args, **kwargs):
-        request.session['view'] = kwargs.get('view', 'icon')
-        return super(FileBrowse, self).get(request, *args, **kwargs)
+        # messages are part of the page, such a page must not be kept
+        cacheable = not conditional.has_pending_messages(request)
+        response = super(FileBrowse, self).get(request, *args, **kwargs)
+        return conditional.patch_browse_cache(response, request.GET.get('id'), cacheable)
 
     def get_template_names(self):
-        return ['repository/file_browse_{}.html'.format(self.request.session['view'])]
+        view = self.kwargs.get('view', 'icon')
+        if view not in BROWSE_VIEWS:
+            raise Http404(_('Unknown view: {}').format(view))
+        return ['repository/file_browse_{}.html'.format(view)]
 
     def get_context_data(self, **kwargs):
         short_id = self.request.GET.get('id', None)
         path = self.request.GET.get('path', None)
 
         ctx = super(FileBrowse, self).get_context_data(**kwargs)
-        repo = self.get_object()
-
-        command = ['restic', '-r', repo.path, 'ls', short_id, path, '--json']
-        result = restic_command(repo, command)
-
-        results = result.stdout.decode(encoding='UTF-8').split('\n')
-        pathlist = []
-        for item in results:
-            if item != '':
-                json_item = json.loads(item, object_hook=lambda d: SimpleNamespace(**d))
-                if json_item.struct_type == 'snapshot':
-                    snapshot = json_item
-                elif json_item.struct_type == 'node':
-                    if path == json_item.path:
-                        delete_to(json_item.name)
-                        push(json_item.name, json_item.path)
-                    else:
-                        pathlist.append(json_item)
-                else:
-                    pass
+        repo = self.object
 
+        index_path = snapshot_index.find(repo, short_id)
+        if index_path is not None:
+            snapshot_index.touch(index_path)
+            snapshot, current, pathlist = snapshot_index.browse(index_path, path)
+        else:
+            snapshot, current, pathlist = list_directory(repo, short_id, path)
+            # listing the whole tree takes long, the index is ready for later clicks;
+            # by full id, "latest" or a short id would not name one snapshot
+            if snapshot is not None:
+                snapshot_index.build_async(repo, snapshot.id)
+
+        # the breadcrumbs follow from the path, a browse request writes nothing
+        current_path = current.path if current is not None else snapshot_index.normalize(path)
         ctx['snapshot'] = snapshot
         ctx['path_list'] = pathlist
-        ctx['current'] = peek()
-        ctx['stack'] = CallStack.objects.all()
+        ctx['current'] = {'name': os.path.basename(current_path), 'path': current_path}
+        ctx['breadcrumbs'] = path_breadcrumbs(current_path)
 
         return ctx
 
@@ -252,78 +348,51 @@ class RestoreView(LoginRequiredMixin, BSModalFormView):
     template_name = 'repository/restore_modal.html'
     success_url = '/'
 
-    def get(self, request, *args, **kwargs):
-        request.session['view'] = kwargs.get('view', 'icon')
-        request.session['repo_id'] = kwargs.get('pk', None)
-        request.session['snapshot_id'] = request.GET.get('id', None)
-        request.session['source_path'] = request.GET.get('path', None)
-        request.session['return'] = request.GET.get('return', None)
-        return super(RestoreView, self).get(request, *args, **kwargs)
-
+    # The modal posts to the URL it was loaded from, the repository, the
+    # snapshot and the path stay in the URL instead of the session.
     def get_success_url(self):
-        if self.request.session['return']:
+        if self.request.GET.get('return'):
             return reverse(
                 'repository:snapshots',
-                kwargs={'pk': self.request.session['repo_id']}
+                kwargs={'pk': self.kwargs['pk']}
             )
         else:
             rev_url = reverse(
                 'repository:browse',
                 kwargs={
-                    'pk': self.request.session['repo_id'],
-                    'view': self.request.session['view']
+                    'pk': self.kwargs['pk'],
+                    'view': self.kwargs.get('view', 'icon')
                 }
             )
-            source_path = self.request.session['source_path']
+            source_path = self.request.GET.get('path', '')
             parts = source_path.split('/')
             url = '{url}?id={id}&path={path}'.format(
                 url=rev_url,
-                id=self.request.session['snapshot_id'],
+                id=self.request.GET.get('id', ''),
                 path='/'.join(parts[:-1])
             )
             return url
 
     def form_valid(self, form):
-        if not self.request.is_ajax():
-            snapshot_id = self.request.session['snapshot_id']
-            source_path = self.request.session['source_path']
+        if not is_ajax(self.request.META):
+            snapshot_id = self.request.GET.get('id', None)
+            source_path = self.request.GET.get('path', None)
             dest_path = form.cleaned_data['path']
 
             # restore to path
-            repo = Repository.objects.get(pk=self.request.session['repo_id'])
+            repo = get_object_or_404(Repository, pk=self.kwargs['pk'])
 
             if dest_path == '':
-                command = [
-                    'restic', '-r', repo.path, 'restore', snapshot_id,
-                    '--include', source_path, '--target', '/'
-                ]
-                msg = _('{src} successfully restored').format(
-                    src=source_path,
-                    dest=dest_path
-                )
-                Journal.objects.create(
-                    user=self.request.user,
-                    repo=repo,
-                    action='3',
-                    data=source_path
-                )
+                data = source_path
             else:
-                command = [
-                    'restic', '-r', repo.path, 'restore', snapshot_id,
-                    '--include', source_path, '--target', dest_path
-                ]
-                msg = _('{src} successfully restored to {dest}').format(
-                    src=source_path,
-                    dest=dest_path
-                )
-                Journal.objects.create(
-                    user=self.request.user,
-                    repo=repo,
-                    action='3',
-                    data='{} --> {}'.format(source_path, dest_path)
-                )
-            restic_command(repo, command)
-            messages.success(self.request, msg)
+                data = '{} --> {}'.format(source_path, dest_path)
+            job = jobs.enqueue(
+                self.request.user, repo, '3', data,
+                snapshot_id=snapshot_id, path=source_path, target=dest_path,
+                return_url=self.get_success_url(),
+            )
+            messages.info(self.request, _('Restore of {src} queued').format(src=source_path))
+            return redirect('repository:job', pk=job.pk)
         return redirect(self.get_success_url())
 
 
@@ -339,28 +408,16 @@ class BackupView(LoginRequiredMixin, DetailView):
         )
 
     def get(self, request, *args, **kwargs):
-        short_id = self.request.GET.get('id', None)
         path = self.request.GET.get('path', None)
-        self.request.session['path'] = path
-        self.request.session['short_id'] = short_id
 
         # backup path
         repo = self.get_object()
-        command = ['restic', '-r', repo.path, 'backup', path]
-        restic_command(repo, command)
-        Journal.objects.create(
-            user=self.request.user,
-            repo=repo,
-            action='1',
-            data=path
+        job = jobs.enqueue(
+            self.request.user, repo, '1', path,
+            path=path, return_url=self.get_success_url(),
         )
-        LogRepoSize(repo)
-        messages.success(self.request,
-                         _('Backup of {path} successfully completed'.format(
-                             path=path,
-                         )),
-                         )
-        return redirect(self.get_success_url())
+        messages.info(self.request, _('Backup of {path} queued').format(path=path))
+        return redirect('repository:job', pk=job.pk)
 
 
 class NewBackupView(LoginRequiredMixin, BSModalFormView):
@@ -368,110 +425,434 @@ class NewBackupView(LoginRequiredMixin, BSModalFormView):
     template_name = 'repository/new_backup_modal.html'
     success_url = '/'
 
-    def get(self, request, *args, **kwargs):
-        request.session['repo_id'] = kwargs.get('pk', None)
-        return super(NewBackupView, self).get(request, *args, **kwargs)
-
     def form_valid(self, form):
-        if not self.request.is_ajax():
+        if not is_ajax(self.request.META):
             path = form.cleaned_data['path']
 
             # backup path
-            repo = Repository.objects.get(pk=self.request.session['repo_id'])
-            command = ['restic', '-r', repo.path, 'backup', path]
-            restic_command(repo, command)
-            Journal.objects.create(
-                user=self.request.user,
-                repo=repo,
-                action='1',
-                data='{} --> {}'.format(path, repo.path)
+            repo = get_object_or_404(Repository, pk=self.kwargs['pk'])
+            job = jobs.enqueue(
+                self.request.user, repo, '1', '{} --> {}'.format(path, repo.path),
+                path=path, return_url=reverse('repository:list'),
             )
-            messages.success(self.request,
-                             _('Backup of {path} successfully completed'.format(
-                                 path=path,
-                             )),
-                             )
+            messages.info(self.request, _('Backup of {path} queued').format(path=path))
+            return redirect('repository:job', pk=job.pk)
         return redirect(self.get_success_url())
 
 
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def journal_cursor(entry):
+    """Position of a journal entry as "<microseconds since epoch>-<id>"."""
+    microseconds = (entry.timestamp - EPOCH) // datetime.timedelta(microseconds=1)
+    return '{}-{}'.format(microseconds, entry.pk)
+
+
+def parse_journal_cursor(value):
+    try:
+        microseconds, pk = value.split('-')
+        return EPOCH + datetime.timedelta(microseconds=int(microseconds)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
 class JournalView(LoginRequiredMixin, ListView):
+    """
+    Keyset pagination on (timestamp, id): `before` shows the entries older
+    than a cursor, `after` the ones newer, so a page costs the same no
+    matter how deep it is. Both use the indexes of Journal.
+    """
     model = Journal
+    context_object_name = 'journal_list'
+    template_name = 'repository/journal_list.html'
+    page_size = 50
+
+    def get_filter_form(self):
+        if not hasattr(self, 'filter_form'):
+            self.filter_form = JournalFilterForm(self.request.GET or None)
+        return self.filter_form
+
+    def get_filtered_queryset(self):
+        qs = Journal.objects.all()
+        form = self.get_filter_form()
+        if form.is_bound and form.is_valid():
+            data = form.cleaned_data
+            if data['repo']:
+                qs = qs.filter(repo=data['repo'])
+            if data['action']:
+                qs = qs.filter(action=data['action'])
+            if data['user']:
+                qs = qs.filter(user=data['user'])
+            if data['start']:
+                start = datetime.datetime.combine(data['start'], datetime.time.min)
+                qs = qs.filter(timestamp__gte=timezone.make_aware(start))
+            if data['end']:
+                end = datetime.datetime.combine(data['end'] + datetime.timedelta(days=1), datetime.time.min)
+                qs = qs.filter(timestamp__lt=timezone.make_aware(end))
+        return qs
+
+    def get_queryset(self):
+        qs = self.get_filtered_queryset()
+        newest_first = qs.select_related('user', 'repo').order_by('-timestamp', '-id')
+
+        # one entry more than shown tells whether there is a further page,
+        # the page in the other direction is the one the cursor came from
+        after = parse_journal_cursor(self.request.GET.get('after'))
+        before = parse_journal_cursor(self.request.GET.get('before'))
+        if after is not None:
+            timestamp, pk = after
+            entries = list(newest_first.filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk)
+            ).reverse()[:self.page_size + 1])
+            self.has_newer = len(entries) > self.page_size
+            self.has_older = True
+            return list(reversed(entries[:self.page_size]))
+        if before is not None:
+            timestamp, pk = before
+            newest_first = newest_first.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+            )
+        entries = list(newest_first[:self.page_size + 1])
+        self.has_newer = before is not None
+        self.has_older = len(entries) > self.page_size
+        return entries[:self.page_size]
+
+    def page_url(self, name, entry):
+        params = self.request.GET.copy()
+        for key in ('before', 'after'):
+            params.pop(key, None)
+        params[name] = journal_cursor(entry)
+        return '?' + params.urlencode()
+
+    def get_context_data(self, **kwargs):
+        ctx = super(JournalView, self).get_context_data(**kwargs)
+        entries = ctx['journal_list']
+        ctx['filter_form'] = self.get_filter_form()
+        if entries:
+            if self.has_newer:
+                ctx['newer_url'] = self.page_url('after', entries[0])
+            if self.has_older:
+                ctx['older_url'] = self.page_url('before', entries[-1])
+        return ctx
+
 
+_END = object()
 
-class Download(DetailView):
+
+async def iterate_in_thread(iterator):
+    """
+    Steps through the synchronous `iterator` in a thread, one chunk at a
+    time. Closing this iterator (e.g. when the client disconnects) closes
+    `iterator`.
+    """
+    try:
+        while True:
+            chunk = await sync_to_async(next)(iterator, _END)
+            if chunk is _END:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def streaming_content(request, iterator):
+    """
+    Under ASGI Django collects a synchronous streaming response completely
+    before the first byte is sent, i.e. a whole archive would be held in
+    memory. There the chunks are read one by one in a thread instead.
+    """
+    if isinstance(request, ASGIRequest):
+        return iterate_in_thread(iterator)
+    return iterator
+
+
+def read_file(file, block_size):
+    try:
+        while True:
+            data = file.read(block_size)
+            if not data:
+                return
+            yield data
+    finally:
+        file.close()
+
+
+class Download(LoginRequiredMixin, DetailView):
     model = Repository
 
     def get_success_url(self):
-        if self.request.session['return']:
-            return reverse(
-                'repository:snapshots',
-                kwargs={'pk': self.request.session['repo_id']}
-            )
-        else:
-            rev_url = reverse(
-                'repository:browse',
-                kwargs={
-                    'pk': self.request.session['repo_id'],
-                    'view': self.request.session['view']
-                }
-            )
-            source_path = self.request.session['source_path']
-            parts = source_path.split('/')
-            url = '{url}?id={id}&path={path}'.format(
-                url=rev_url,
-                id=self.request.session['snapshot_id'],
-                path='/'.join(parts[:-1])
+        rev_url = reverse(
+            'repository:browse',
+            kwargs={
+                'pk': self.kwargs['pk'],
+                'view': self.kwargs.get('view', 'icon')
+            }
+        )
+        source_path = self.request.GET.get('path', '')
+        parts = source_path.split('/')
+        url = '{url}?id={id}&path={path}'.format(
+            url=rev_url,
+            id=self.request.GET.get('id', ''),
+            path='/'.join(parts[:-1])
+        )
+        return url
+
+    def stream_archive(self, stream, chunks, first_chunk, repo, path):
+        # Closing the response (e.g. when the client disconnects) closes
+        # this generator, the finally block then kills restic.
+        completed = False
+        try:
+            yield first_chunk
+            yield from chunks
+            completed = stream.returncode == 0
+        finally:
+            stream.close()
+            Journal.objects.create(
+                user=self.request.user,
+                repo=repo,
+                action='2',
+                data='{}'.format(path),
+                success=completed,
             )
-            return url
 
     def get(self, request, *args, **kwargs):
-        request.session['view'] = kwargs.get('view', 'icon')
-        repo_id = kwargs.get('pk', None)
+        repo = self.get_object()
         snapshot_id = request.GET.get('id', None)
         path = request.GET.get('path', None)
-        repo = Repository.objects.get(pk=repo_id)
-
-        temp_path = getattr(settings, "TEMP_PATH", None)
-        if temp_path is None:
-            messages.error(
-                self.request,
-                _('You need to set the download path in localsetting.py to enable downloads')
-            )
+        archive = request.GET.get('format', getattr(settings, 'DOWNLOAD_ARCHIVE_FORMAT', 'zip'))
+        if archive not in ('zip', 'tar'):
+            archive = 'zip'
+
+        # restic writes the archive to stdout, nothing is staged on disk
+        command = ['restic', '-r', repo.path, 'dump', '--archive', archive, snapshot_id, path]
+        stream = ResticStream(repo, command)
+        chunks = stream.iter_bytes()
+        # wait for the first chunk, restic fails early on an unknown snapshot or path
+        first_chunk = next(chunks, b'')
+        if not first_chunk:
+            stream.close()
+            messages.error(self.request, stream.stderr.decode() or _('Download failed'))
             return redirect(self.get_success_url())
-        download_path = os.path.join(temp_path, slugify(repo.name))
-
-        # restore to temp path
-        command = [
-            'restic', '-r', repo.path, 'restore', snapshot_id,
-            '--include', path, '--target', download_path
-        ]
-        restic_command(repo, command)
+
+        archive_name = '{}_{}.{}'.format(
+            slugify(repo.name),
+            os.path.basename(os.path.normpath(path)),
+            archive
+        )
+        content_type = 'application/zip' if archive == 'zip' else 'application/x-tar'
+        resp = StreamingHttpResponse(
+            streaming_content(request, self.stream_archive(stream, chunks, first_chunk, repo, path)),
+            content_type=content_type
+        )
+        resp['Content-Disposition'] = 'attachment; filename=%s' % archive_name
+        return resp
+
+
+class FileDownload(Download):
+    """
+    Serves a single file with its content type and Range support. Files are
+    dumped into the download cache (if DOWNLOAD_CACHE_PATH is set) while
+    they are streamed, repeated and resumed downloads are answered from there.
+    """
+
+    def log(self, repo, path, success):
         Journal.objects.create(
             user=self.request.user,
             repo=repo,
             action='2',
-            data='{}'.format(path)
+            data='{}'.format(path),
+            success=success,
         )
 
-        zip_filename = '{}_{}'.format(
-            slugify(repo.name),
-            os.path.basename(os.path.normpath(path))
-        )
-        zip_fullpath = os.path.join(temp_path, zip_filename)
-        zip_dir = os.path.dirname((os.path.join(download_path, path[1:])))
-        shutil.make_archive(
-            zip_fullpath,
-            'zip',
-            zip_dir
-        )
+    def stream_file(self, stream, chunks, writer, byte_range, size, repo, path):
+        """
+        Yields the bytes `byte_range` of the dumped file while all of it
+        goes into `writer`. restic is stopped after the range unless the
+        range reaches the end of the file, only then it can be cached.
+        """
+        first, last = byte_range
+        position = 0
+        try:
+            for chunk in chunks:
+                start, position = position, position + len(chunk)
+                if writer is not None:
+                    writer.write(chunk)
+                if position > first and start <= last:
+                    yield chunk[max(first - start, 0):last + 1 - start]
+                if position > last and last < size - 1:
+                    break
+        finally:
+            stream.close()
+            sent = position > last
+            if writer is not None:
+                if stream.returncode == 0 and not stream.killed:
+                    writer.commit()
+                else:
+                    writer.discard()
+            if byte_range == (0, size - 1):
+                self.log(repo, path, sent)
 
-        zip_name = zip_filename + '.zip'
-        zip_fullpath = os.path.join(temp_path, zip_name)
+    def cached_response(self, cached, filename, range_header):
+        size = os.path.getsize(cached)
+        try:
+            byte_range = download_cache.parse_range(range_header, size)
+        except ValueError:
+            return self.not_satisfiable(size)
 
-        zip_file = open(zip_fullpath, 'rb')
-        resp = FileResponse(zip_file, content_type="application/force-download")
-        resp['Content-Disposition'] = 'attachment; filename=%s' % zip_name
+        f = open(cached, 'rb')
+        if byte_range is None:
+            resp = FileResponse(f, as_attachment=True, filename=filename)
+        else:
+            first, last = byte_range
+            f.seek(first)
+            resp = FileResponse(
+                download_cache.RangeFile(f, last - first + 1),
+                as_attachment=True, filename=filename, status=206
+            )
+            resp['Content-Length'] = last - first + 1
+            resp['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+        resp['Accept-Ranges'] = 'bytes'
+        if isinstance(self.request, ASGIRequest):
+            # FileResponse reads synchronously as well, see streaming_content()
+            resp.streaming_content = iterate_in_thread(read_file(resp.file_to_stream, resp.block_size))
+        return resp
 
-        os.remove(zip_fullpath)
-        shutil.rmtree(download_path)
+    def not_satisfiable(self, size):
+        resp = HttpResponse(status=416)
+        resp['Content-Range'] = 'bytes */%d' % size
         return resp
+
+    def get(self, request, *args, **kwargs):
+        repo = self.get_object()
+        path = request.GET.get('path', None)
+        filename = os.path.basename(os.path.normpath(path))
+        range_header = request.headers.get('Range')
+
+        # the cache key needs the full id, `latest` may point to another snapshot tomorrow
+        snapshot_id, node = download_cache.resolve(repo, request.GET.get('id', None), path)
+        if node is None or node.type != 'file':
+            messages.error(self.request, _('File not found: {}').format(path))
+            return redirect(self.get_success_url())
+
+        cached = download_cache.lookup(repo, snapshot_id, path)
+        if cached is not None:
+            if not range_header:
+                self.log(repo, path, True)
+            return self.cached_response(cached, filename, range_header)
+
+        size = node.size or 0
+        try:
+            byte_range = download_cache.parse_range(range_header, size)
+        except ValueError:
+            return self.not_satisfiable(size)
+
+        stream = ResticStream(repo, download_cache.dump_command(repo, snapshot_id, path))
+        chunks = stream.iter_bytes()
+        first_chunk = next(chunks, b'')
+        if not first_chunk and stream.returncode:
+            messages.error(self.request, stream.stderr.decode() or _('Download failed'))
+            return redirect(self.get_success_url())
+
+        # a file larger than the whole cache is not even written
+        caching = download_cache.cache_root() is not None and size <= download_cache.max_size()
+        writer = download_cache.CacheWriter(repo, snapshot_id, path) if caching else None
+        content_type, encoding = mimetypes.guess_type(filename)
+        resp = StreamingHttpResponse(
+            streaming_content(request, self.stream_file(
+                stream, itertools.chain([first_chunk], chunks), writer,
+                byte_range or (0, size - 1), size, repo, path,
+            )),
+            content_type=content_type if content_type and not encoding else 'application/octet-stream'
+        )
+        resp['Content-Disposition'] = content_disposition_header(True, filename)
+        resp['Accept-Ranges'] = 'bytes'
+        if byte_range is None:
+            resp['Content-Length'] = size
+        else:
+            first, last = byte_range
+            resp.status_code = 206
+            resp['Content-Length'] = last - first + 1
+            resp['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+        return resp
+
+
+class JobList(LoginRequiredMixin, ListView):
+    model = Job
+    paginate_by = 50
+
+    def get_queryset(self):
+        return Job.objects.select_related('user', 'repo')
+
+
+class JobDetail(LoginRequiredMixin, DetailView):
+    model = Job
+
+
+def job_event(job):
+    progress = job.progress
+    event = {
+        'status': job.status,
+        'status_display': str(job.get_status_display()),
+        'finished': job.is_finished,
+        'progress': progress,
+    }
+    if progress:
+        event['bytes'] = '{} / {}'.format(
+            humanize.naturalsize(progress['bytes_done'], binary=False),
+            humanize.naturalsize(progress['total_bytes'], binary=False),
+        )
+        event['rate'] = humanize.naturalsize(progress['bytes_per_second'], binary=False) + '/s'
+    return 'event: progress\ndata: {}\n\n'.format(json.dumps(event))
+
+
+async def job_event_stream(pk):
+    interval = jobs.progress_interval()
+    last_event = None
+    idle = 0
+    while True:
+        try:
+            job = await Job.objects.aget(pk=pk)
+        except Job.DoesNotExist:
+            # deleted in the meantime, nothing more to report
+            break
+        event = job_event(job)
+        if event != last_event:
+            last_event = event
+            idle = 0
+            yield event
+        else:
+            idle += interval
+            if idle >= 15:
+                # keep proxies from closing an idle connection
+                idle = 0
+                yield ': keepalive\n\n'
+        if job.is_finished:
+            break
+        await asyncio.sleep(interval)
+
+
+async def job_events(request, pk):
+    """
+    Pushes status and progress of a job as Server-Sent Events, at most
+    once per JOB_PROGRESS_INTERVAL. A WSGI server would have to buffer
+    the whole stream until the job has finished, there the current state
+    is sent as a single event and the browser asks again after `retry`
+    milliseconds. Served by ASGI (django_restic_gui/asgi.py) the events
+    are pushed on one connection.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponseForbidden()
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if not isinstance(request, ASGIRequest):
+        job = await Job.objects.filter(pk=pk).afirst()
+        if job is None:
+            raise Http404
+        retry = 'retry: {}\n\n'.format(int(max(jobs.progress_interval(), 1) * 1000))
+        return HttpResponse(retry + job_event(job), content_type='text/event-stream', headers=headers)
+    if not await Job.objects.filter(pk=pk).aexists():
+        raise Http404
+    return StreamingHttpResponse(job_event_stream(pk), content_type='text/event-stream', headers=headers)